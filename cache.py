@@ -0,0 +1,237 @@
+"""Process-wide result cache with single-flight refresh.
+
+`st.cache_data` lets every session whose rerun lands on an expired entry
+run the query itself, so a TTL expiry under many open sessions turns into
+a burst of identical aggregations. Here one caller per key recomputes
+while concurrent callers for the same key wait on its lock and then reuse
+the fresh value, so the database sees at most one query per key per TTL
+regardless of the number of sessions.
+
+Bounded by bytes (`max_mb_setting`), the same cache replaces the
+unbounded `st.cache_data` for paged results: entries are sized once when
+stored, the least recently used go first, and every session reads the
+one stored object instead of unpickling its own copy.
+
+A miss is first looked up in the shared backend selected by CACHE_BACKEND
+(cache_backends.py), so replicas behind a load balancer share one query
+per key per TTL as well. `clear()` drops the shared results too, and
+`refresh()` skips a shared result that is past half its TTL, so both
+really recompute.
+
+`LRUCache` is the bounded per-key counterpart for small documents fetched
+by id. Values in both are shared between sessions, not copied: callers
+must treat them as read-only.
+"""
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import cache_backends
+import metrics
+from config import get_setting
+
+
+def sizeof(value):
+    """Approximate in-memory size of a cached result in bytes"""
+    if hasattr(value, "memory_usage"):  # pandas DataFrame
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, "nbytes"):  # pyarrow Table, numpy array
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(sizeof(item) for item in value)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class SingleFlightCache:
+    """TTL cache where a missing or expired key is computed by one caller at a time.
+
+    With `max_bytes` set the cache also bounds the total size of its
+    values, evicting least recently used entries first.
+    """
+
+    def __init__(self, name, ttl, max_bytes=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._locks = {}  # key -> [lock, users], only while a key is in flight
+        self._lock = threading.Lock()
+
+    def _acquire(self, key):
+        with self._lock:
+            slot = self._locks.get(key)
+            if slot is None:
+                slot = self._locks[key] = [threading.Lock(), 0]
+            slot[1] += 1
+        return slot
+
+    def _release(self, key, slot):
+        slot[0].release()
+        with self._lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[key]
+
+    def _fresh(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, ttl, max_bytes):
+        size = sizeof(value) if max_bytes else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            if max_bytes and size > max_bytes:
+                return  # larger than the whole cache: hand it out uncached
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self.size += size
+            while max_bytes and self.size > max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                metrics.REGISTRY.inc("dashboard_cache_evictions_total", {"cache": self.name, "type": "single_flight"})
+
+    def get_or_compute(self, key, compute, ttl=None, max_bytes=None):
+        """Return the cached value for `key`, running `compute()` only if it is stale"""
+        ttl = self.ttl if ttl is None else ttl
+        return self.get_or_load(key, lambda: (compute(), ttl), max_bytes)
+
+    def get_or_load(self, key, load, max_bytes=None):
+        """Like get_or_compute, but `load()` returns (value, ttl seconds to keep it)"""
+        labels = {"cache": self.name, "type": "single_flight"}
+        metrics.REGISTRY.inc("dashboard_cache_calls_total", labels)
+
+        entry = self._fresh(key)
+        if entry is not None:
+            return entry[0]
+
+        slot = self._acquire(key)
+        if not slot[0].acquire(blocking=False):
+            # Another caller is refreshing this key: wait for it and reuse its result
+            metrics.REGISTRY.inc("dashboard_cache_waits_total", labels)
+            slot[0].acquire()
+        try:
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry[0]
+            metrics.REGISTRY.inc("dashboard_cache_misses_total", labels)
+            value, ttl = load()
+            self._store(key, value, ttl, self.max_bytes if max_bytes is None else max_bytes)
+            return value
+        finally:
+            self._release(key, slot)
+
+    def refresh(self, key, load, max_bytes=None):
+        """Reload `key` now, whether or not it is fresh; concurrent readers keep the old value"""
+        slot = self._acquire(key)
+        slot[0].acquire()
+        try:
+            value, ttl = load()
+            self._store(key, value, ttl, self.max_bytes if max_bytes is None else max_bytes)
+            return value
+        finally:
+            self._release(key, slot)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def single_flight(ttl_setting, default_ttl, max_mb_setting=None, default_max_mb=None):
+    """Cache a function per argument tuple; the TTL is read from `ttl_setting`.
+
+    With `max_mb_setting` the cached results are bounded to that many MB in
+    total, evicting the least recently used ones.
+    """
+    def decorator(func):
+        cache = SingleFlightCache(func.__name__, default_ttl)
+        if max_mb_setting:
+            metrics.register_gauges(lambda: {
+                f"dashboard_result_cache_bytes_{cache.name}": cache.size,
+                f"dashboard_result_cache_entries_{cache.name}": len(cache._entries),
+            })
+
+        def prepare(args, kwargs, refresh=False):
+            """(key, load, max_bytes) for one call; load goes through the shared backend"""
+            key = (args, tuple(sorted(kwargs.items())))
+            ttl = get_setting(ttl_setting, default_ttl, float)
+            max_bytes = None
+            if max_mb_setting:
+                max_bytes = int(get_setting(max_mb_setting, default_max_mb, float) * 1024 * 1024)
+            # A refresh reuses only a shared result stored within the last half
+            # TTL, so replicas refreshing on the same schedule still share one query
+            min_ttl = ttl / 2 if refresh else 0
+
+            def load():
+                backend = cache_backends.get_backend()
+                return backend.fetch(cache.name, key, lambda: func(*args, **kwargs), ttl, min_ttl)
+            return key, load, max_bytes
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_load(*prepare(args, kwargs))
+
+        def refresh(*args, **kwargs):
+            """Reload the result for these arguments ahead of its expiry"""
+            return cache.refresh(*prepare(args, kwargs, refresh=True))
+
+        def clear():
+            """Drop every cached result, here and in the shared backend"""
+            cache.clear()
+            cache_backends.get_backend().clear(cache.name)
+
+        wrapper.cache = cache
+        wrapper.clear = clear
+        wrapper.refresh = refresh
+        return wrapper
+    return decorator
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU of small values, each kept for at most `ttl` seconds"""
+
+    def __init__(self, name, max_entries, ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """{key: value} for the keys that are cached and fresh"""
+        labels = {"cache": self.name, "type": "lru"}
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[1] <= now:
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+        metrics.REGISTRY.inc("dashboard_cache_calls_total", labels, len(keys))
+        metrics.REGISTRY.inc("dashboard_cache_misses_total", labels, len(keys) - len(found))
+        return found
+
+    def put_many(self, items):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,294 @@
+"""Shared second-level store behind the single-flight caches.
+
+With several dashboard replicas behind a load balancer each process would
+otherwise run its own copy of every cached query. CACHE_BACKEND selects a
+store that all replicas share:
+
+    local                  no shared store (default): each process queries itself
+    sqlite:///path/to.db   SQLite file on local disk, for processes on one host
+    redis://host:6379/0    Redis or any Redis-compatible server (needs `redis`)
+
+SQLite runs in WAL mode, which relies on shared memory between the
+processes and does not work on network filesystems (NFS, SMB, Azure
+Files): use it only for several processes on the same host. Replicas on
+different hosts share Redis.
+
+On a local miss a replica first reads the shared store; only when that
+misses too does it take a short cross-replica lock and run the query,
+while other replicas poll for its result. Keys carry a format version and
+CACHE_VERSION, so a deploy that changes result shapes never reads stale
+entries. Values are pickled and zlib-compressed.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+import metrics
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of any cached result changes
+FORMAT_VERSION = 1
+
+
+def dumps(value):
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def loads(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+def name_prefix(name):
+    """Versioned prefix shared by every store key of the cached function `name`"""
+    prefix = get_setting("CACHE_KEY_PREFIX", "helmet-dashboard")
+    version = get_setting("CACHE_VERSION", "1")
+    return f"{prefix}:{FORMAT_VERSION}.{version}:{name}:"
+
+
+def shared_key(name, key):
+    """Versioned store key for `name` called with the argument tuple `key`"""
+    return name_prefix(name) + hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class Backend:
+    """A shared byte store with TTLs and an advisory lock per key"""
+
+    shared = True
+    errors = (OSError, sqlite3.Error)
+
+    def get(self, key):
+        """(data, remaining ttl seconds) or None"""
+        raise NotImplementedError
+
+    def set(self, key, data, ttl):
+        raise NotImplementedError
+
+    def acquire(self, key, seconds):
+        """A token if the lock on `key` was taken, else None"""
+        raise NotImplementedError
+
+    def release(self, key, token):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Delete every stored value whose key starts with `prefix`"""
+        raise NotImplementedError
+
+    def _error(self, e):
+        # A shared store outage must not take the dashboard down
+        metrics.REGISTRY.inc("dashboard_cache_backend_errors_total", {"backend": type(self).__name__})
+        logger.warning("Cache backend error (%s); querying directly", e)
+
+    def _get(self, key, min_ttl):
+        """get(), treating a value with `min_ttl` seconds or less left as missing"""
+        found = self.get(key)
+        if found is not None and found[1] <= min_ttl:
+            return None
+        return found
+
+    def clear(self, name):
+        """Drop the stored results of `name`, so every replica computes them again"""
+        try:
+            self.delete_prefix(name_prefix(name))
+        except self.errors as e:
+            self._error(e)
+
+    def fetch(self, name, key, compute, ttl, min_ttl=0):
+        """(value, remaining ttl): from the store, or computed by one replica and stored.
+
+        A stored value with `min_ttl` seconds or less left is computed again.
+        """
+        store_key = shared_key(name, key)
+        lock_key = f"{store_key}:lock"
+        lock_seconds = get_setting("CACHE_LOCK_SECONDS", 30, float)
+
+        try:
+            found = self._get(store_key, min_ttl)
+            token = None if found is not None else self.acquire(lock_key, lock_seconds)
+        except self.errors as e:
+            self._error(e)
+            return compute(), ttl
+        if found is not None:
+            return loads(found[0]), found[1]
+
+        if token is None:
+            # Another replica is computing this key: wait for its result
+            metrics.REGISTRY.inc("dashboard_cache_backend_waits_total", {"backend": type(self).__name__})
+            deadline = time.monotonic() + lock_seconds
+            delay = 0.05
+            while time.monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+                try:
+                    found = self._get(store_key, min_ttl)
+                except self.errors as e:
+                    self._error(e)
+                    break
+                if found is not None:
+                    return loads(found[0]), found[1]
+            # The lock holder is gone, too slow or unreachable: compute here
+            return compute(), ttl
+
+        try:
+            # Another replica may have finished between our read and the lock
+            try:
+                found = self._get(store_key, min_ttl)
+            except self.errors as e:
+                self._error(e)
+            if found is not None:
+                return loads(found[0]), found[1]
+            value = compute()
+            try:
+                self.set(store_key, dumps(value), ttl)
+            except self.errors as e:
+                self._error(e)
+            return value, ttl
+        finally:
+            try:
+                self.release(lock_key, token)
+            except self.errors as e:
+                self._error(e)
+
+
+class LocalBackend(Backend):
+    """No shared store: every process computes for itself"""
+
+    shared = False
+
+    def clear(self, name):
+        pass
+
+    def fetch(self, name, key, compute, ttl, min_ttl=0):
+        return compute(), ttl
+
+
+class SQLiteBackend(Backend):
+    """Store in one SQLite file on local disk, shared by the processes of one host.
+
+    WAL mode, one connection per thread. Not for a network filesystem.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks "
+                "(key TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1] - time.time()
+
+    def set(self, key, data, ttl):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, data, time.time() + ttl)
+            )
+            # Expired entries are dropped as new ones arrive
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def acquire(self, key, seconds):
+        token = uuid.uuid4().hex
+        with self._connection() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, time.time()))
+            taken = conn.execute(
+                "INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)",
+                (key, token, time.time() + seconds)
+            ).rowcount
+        return token if taken else None
+
+    def release(self, key, token):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    def delete_prefix(self, prefix):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+
+class RedisBackend(Backend):
+    """Shared store on a Redis-compatible server"""
+
+    # Delete the lock only if this replica still holds it
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    )
+
+    def __init__(self, url):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._release = self._redis.register_script(self.RELEASE_SCRIPT)
+        self.errors = (redis.RedisError, OSError)
+
+    def get(self, key):
+        pipe = self._redis.pipeline()
+        pipe.get(key)
+        pipe.pttl(key)
+        data, remaining_ms = pipe.execute()
+        if data is None:
+            return None
+        return data, max(remaining_ms, 0) / 1000
+
+    def set(self, key, data, ttl):
+        self._redis.set(key, data, px=int(ttl * 1000))
+
+    def acquire(self, key, seconds):
+        token = uuid.uuid4().hex
+        return token if self._redis.set(key, token, nx=True, px=int(seconds * 1000)) else None
+
+    def release(self, key, token):
+        self._release(keys=[key], args=[token])
+
+    def delete_prefix(self, prefix):
+        # Keys are hex digests after the prefix; only the prefix needs glob escaping
+        pattern = "".join(f"\\{c}" if c in "*?[]\\" else c for c in prefix) + "*"
+        # Locks of keys being computed right now stay with their holders
+        keys = [key for key in self._redis.scan_iter(match=pattern, count=1000) if not key.endswith(b":lock")]
+        for start in range(0, len(keys), 1000):
+            self._redis.delete(*keys[start:start + 1000])
+
+
+def create_backend(url):
+    """Backend for a CACHE_BACKEND value"""
+    if not url or url == "local":
+        return LocalBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_BACKEND: {url}")
+
+
+@metrics.cache_resource()
+def get_backend():
+    """The process-wide shared cache backend"""
+    return create_backend(get_setting("CACHE_BACKEND", "local"))
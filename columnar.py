@@ -0,0 +1,88 @@
+"""Columnar decoding of query results into typed DataFrames.
+
+The table pages used to build `pd.DataFrame(records)` from lists of fully
+decoded dicts and then shape the columns row by row. Here a projected
+cursor is decoded straight into one array per field: through pymongoarrow
+when it is installed, otherwise by draining the cursor's batches into
+per-field lists. Each column is then converted once to its final dtype.
+"""
+import pandas as pd
+from bson import ObjectId
+
+# Column kinds and the pandas dtype each one ends up as
+DTYPES = {
+    "datetime": "datetime64[ns]",
+    "int": "Int8",
+    "float": "float32",
+    "category": "category",
+}
+
+
+def _arrow_schema(schema):
+    import pyarrow as pa
+    from pymongoarrow.api import Schema
+    from pymongoarrow.types import ObjectIdType
+
+    types = {
+        "objectid": ObjectIdType(),
+        "string": pa.string(),
+        "datetime": pa.timestamp("ms"),
+        "int": pa.int32(),
+        "float": pa.float64(),
+        "category": pa.string(),
+    }
+    return Schema({field: types[kind] for field, kind in schema.items()})
+
+
+def _find_arrow(collection, query, schema, sort, limit):
+    """Decode with pymongoarrow; None when it is not installed"""
+    try:
+        from pymongoarrow.api import find_arrow_all
+    except ImportError:
+        return None
+    table = find_arrow_all(collection, query, schema=_arrow_schema(schema), sort=sort, limit=limit)
+    return table.to_pandas()
+
+
+def decode(cursor, fields):
+    """Drain `cursor` into {field: list} without keeping any per-row dict"""
+    columns = {field: [] for field in fields}
+    appends = [(field, columns[field].append) for field in fields]
+    for doc in cursor:
+        for field, append in appends:
+            append(doc.get(field))
+    return columns
+
+
+def typed(frame, schema):
+    """Convert every column of `frame` to the dtype of its kind in `schema`"""
+    for field, kind in schema.items():
+        column = frame[field]
+        if kind == "objectid":
+            # pymongoarrow hands ObjectIds back as their 12 raw bytes
+            frame[field] = [ObjectId(bytes(v)) if isinstance(v, (bytes, bytearray)) else v for v in column]
+        elif kind == "datetime":
+            frame[field] = pd.to_datetime(column)
+        elif kind in ("int", "float"):
+            frame[field] = pd.to_numeric(column).astype(DTYPES[kind])
+        elif kind in DTYPES:
+            frame[field] = column.astype(DTYPES[kind])
+    return frame
+
+
+def find_frame(collection, query, schema, sort=None, limit=0):
+    """Run a find projected to `schema` ({field: kind}) and return a typed DataFrame"""
+    frame = _find_arrow(collection, query, schema, sort, limit)
+    if frame is None:
+        projection = {field: 1 for field in schema}
+        projection.setdefault("_id", 0)
+        cursor = collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        # A dict of lists becomes one object array per column, no row objects
+        frame = pd.DataFrame(decode(cursor, schema), columns=list(schema))
+    if frame.empty:
+        return frame.astype({field: DTYPES.get(kind, object) for field, kind in schema.items()})
+    return typed(frame, schema)
@@ -0,0 +1,32 @@
+"""Runtime settings shared by the dashboard pages and command-line tools.
+
+A setting is read from the environment first, then from Streamlit secrets,
+so the same code runs under `streamlit run` and from a plain shell.
+"""
+import os
+
+import streamlit as st
+
+
+def get_setting(name, default=None, cast=None):
+    """Return setting `name`, converted with `cast` when given"""
+    value = os.environ.get(name)
+
+    if value is None:
+        try:
+            value = st.secrets.get(name)
+        except Exception:
+            # No secrets.toml available (CLI tools, local scripts)
+            value = None
+
+    if value is None:
+        return default
+
+    return cast(value) if cast else value
+
+
+def as_bool(value):
+    """Parse a boolean setting written as true/false, yes/no or 1/0"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -1,14 +1,12 @@
 import streamlit as st
-from pymongo import MongoClient
-import pandas as pd
 import datetime
 from datetime import timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
 import hashlib
 import extra_streamlit_components as stx
 
+import metrics
+from config import get_setting, as_bool
+
 # Page config with custom theme
 st.set_page_config(
     page_title="Helmet Detection Dashboard",
@@ -21,6 +19,13 @@ st.set_page_config(
 # Initialize cookie manager (do NOT cache this as it's a widget)
 cookie_manager = stx.CookieManager()
 
+# ===== LOGO =====
+@metrics.cache_resource()
+def load_logo():
+    """Read logo.png once per process (st.image takes the bytes, no PIL needed)"""
+    with open("logo.png", "rb") as f:
+        return f.read()
+
 # ===== LOGIN SYSTEM WITH COOKIES =====
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -85,7 +90,7 @@ if not st.session_state.logged_in:
     
     # Logo
     try:
-        logo = Image.open("logo.png")
+        logo = load_logo()
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             st.image(logo, use_container_width=True)
@@ -117,6 +122,13 @@ if not st.session_state.logged_in:
     st.stop()
 
 # ===== MAIN DASHBOARD =====
+# Data-layer and pandas imports are deferred until after the login gate,
+# here and in every page, so the login screen of a cold process does not
+# pay for them
+import pandas as pd
+
+import formatting
+import refresher
 
 # Custom CSS
 st.markdown("""
@@ -172,7 +184,7 @@ with st.sidebar:
 
 # === LOGO AND HEADER ===
 try:
-    logo = Image.open("logo.png")
+    logo = load_logo()
     col_empty1, col_content, col_empty2 = st.columns([1, 4, 1])
     
     with col_content:
@@ -192,73 +204,42 @@ except FileNotFoundError:
 except Exception as e:
     st.error(f"Error loading logo: {str(e)}")
 
-# ===== DATABASE CONNECTION =====
-@st.cache_resource
-def init_connection():
-    """Initialize MongoDB connection (cached across reruns)"""
-    return MongoClient(st.secrets["COSMOSDB_CONN_STRING"])
+# Page sizes offered for the recent records table (at most refresher.RECENT_RECORDS_MAX)
+RECENT_LIMIT_OPTIONS = [10, 25, 50, 100]
 
-@st.cache_data(ttl=60)
-def get_database_stats():
-    """Fetch all statistics in a single optimized query"""
-    client = init_connection()
-    collection = client["image_database"]["image_metadata"]
-    
-    pipeline = [
-        {
-            "$facet": {
-                "total": [{"$count": "count"}],
-                "processed": [
-                    {"$match": {"processed": True}},
-                    {"$count": "count"}
-                ],
-                "helmet": [
-                    {"$match": {
-                        "processed": True,
-                        "helmet_status": {"$in": ["helmet", "compliant"]}
-                    }},
-                    {"$count": "count"}
-                ],
-                "no_helmet": [
-                    {"$match": {
-                        "processed": True,
-                        "helmet_status": {"$in": ["no_helmet", "violation"]}
-                    }},
-                    {"$count": "count"}
-                ]
-            }
-        }
-    ]
-    
-    result = list(collection.aggregate(pipeline))[0]
-    
-    return {
-        'total': result['total'][0]['count'] if result['total'] else 0,
-        'processed': result['processed'][0]['count'] if result['processed'] else 0,
-        'helmet': result['helmet'][0]['count'] if result['helmet'] else 0,
-        'no_helmet': result['no_helmet'][0]['count'] if result['no_helmet'] else 0
-    }
 
-@st.cache_data(ttl=60)
-def get_recent_records():
-    """Fetch 10 most recent records regardless of status"""
-    client = init_connection()
-    collection = client["image_database"]["image_metadata"]
+def home_snapshots():
+    """Latest (stats, recent records, refresh error); raises if nothing has loaded yet"""
+    # Snapshots are kept fresh by a background thread; only a cold start waits here
+    home_data = refresher.get_home_refresher()
+    with st.spinner('Memuat data...'):
+        stats_snapshot = home_data.get("stats")
+        recent_snapshot = home_data.get("recent_records")
     
-    recent_records = list(collection.find({}).limit(50))
+    refresh_error = home_data.error("stats") or home_data.error("recent_records")
+    if stats_snapshot is None or recent_snapshot is None:
+        raise RuntimeError(refresh_error)
+    return stats_snapshot, recent_snapshot, refresh_error
+
+
+def show_connection_error(e):
+    st.error(f"⚠️ Terjadi kesalahan koneksi database: {str(e)}")
+    st.info("Pastikan koneksi database tersedia dan credentials benar.")
+
+
+def render_metrics():
+    try:
+        stats_snapshot, _, refresh_error = home_snapshots()
+    except Exception as e:
+        show_connection_error(e)
+        return
     
-    records_sorted = sorted(
-        recent_records, 
-        key=lambda x: x.get('uploaded_at', datetime.datetime.min),
-        reverse=True
-    )
+    stats = stats_snapshot.value
     
-    return records_sorted[:10]
-
-# ===== MAIN DASHBOARD =====
-try:
-    with st.spinner('Memuat data...'):
-        stats = get_database_stats()
+    if refresh_error:
+        st.warning(f"⚠️ Pembaruan data gagal, menampilkan data terakhir yang berhasil dimuat. ({refresh_error})")
+    st.caption(f"🕐 Data diperbarui {stats_snapshot.age:.0f} detik yang lalu")
+    refresher.show_rollup_age()
     
     total = stats['total']
     processed = stats['processed']
@@ -268,8 +249,6 @@ try:
     compliance_rate = (helmet / processed * 100) if processed > 0 else 0
     violation_rate = (no_helmet / processed * 100) if processed > 0 else 0
     
-    st.markdown("---")
-    
     # === METRICS ROW ===
     col1, col2, col3, col4 = st.columns(4)
     
@@ -302,32 +281,41 @@ try:
             value=f"{compliance_rate:.1f}%",
             help="Persentase pengendara yang memakai helm"
         )
+
+
+# === RECENT RECORDS TABLE ===
+def render_recent_records():
+    col_recent_title, col_recent_limit = st.columns([4, 1])
+    
+    with col_recent_limit:
+        recent_limit = st.selectbox(
+            "Jumlah data:",
+            options=RECENT_LIMIT_OPTIONS,
+            index=0
+        )
     
-    st.markdown("---")
+    with col_recent_title:
+        st.subheader(f"🕒 {recent_limit} Data Terbaru")
     
-    # === RECENT RECORDS TABLE ===
-    st.subheader("🕒 10 Data Terbaru")
+    try:
+        _, recent_snapshot, _ = home_snapshots()
+    except Exception as e:
+        show_connection_error(e)
+        return
     
-    recent_records = get_recent_records()
+    # The snapshot is shared by all sessions: slice it, never modify it
+    recent_records = recent_snapshot.value.iloc[:recent_limit]
     
     if len(recent_records) > 0:
-        df_recent = pd.DataFrame(recent_records)
-        
-        df_recent['No'] = range(1, len(df_recent) + 1)
-        
-        if 'uploaded_at' in df_recent.columns:
-            df_recent['Tanggal'] = pd.to_datetime(df_recent['uploaded_at']).dt.strftime('%Y-%m-%d')
-            df_recent['Waktu'] = pd.to_datetime(df_recent['uploaded_at']).dt.strftime('%H:%M:%S')
-        else:
-            df_recent['Tanggal'] = 'N/A'
-            df_recent['Waktu'] = 'N/A'
-        
-        df_recent['Status'] = df_recent['helmet_status'].apply(
-            lambda x: 'Patuh ✅' if x in ['helmet', 'compliant'] else 'Melanggar ❌'
-        )
-        
-        display_df = df_recent[['No', 'Tanggal', 'Waktu', 'filename', 'Status']].copy()
-        display_df.columns = ['No', 'Tanggal', 'Waktu', 'Nama File', 'Status']
+        with metrics.timed("dataframe", "recent_records"):
+            tanggal, waktu = formatting.date_and_time(recent_records['uploaded_at'])
+            display_df = pd.DataFrame({
+                'No': range(1, len(recent_records) + 1),
+                'Tanggal': tanggal,
+                'Waktu': waktu,
+                'Nama File': recent_records['filename'],
+                'Status': formatting.status_labels(recent_records),
+            }, index=recent_records.index)
         
         st.dataframe(
             display_df,
@@ -343,7 +331,7 @@ try:
             st.download_button(
                 label="📥 Download CSV",
                 data=csv,
-                file_name=f"10_data_terbaru_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                file_name=f"{recent_limit}_data_terbaru_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                 mime="text/csv",
                 use_container_width=True
             )
@@ -353,6 +341,28 @@ try:
     else:
         st.info("ℹ️ Tidak ada data yang tersedia")
 
-except Exception as e:
-    st.error(f"⚠️ Terjadi kesalahan koneksi database: {str(e)}")
-    st.info("Pastikan koneksi database tersedia dan credentials benar.")
\ No newline at end of file
+
+# ===== LIVE MODE =====
+# In live mode only the metrics row and the recent table re-run on a timer
+# (as fragments); CSS, logo, sidebar and cookie manager are not re-rendered
+with st.sidebar:
+    live_mode = st.toggle(
+        "📡 Mode live",
+        value=get_setting("LIVE_MODE", False, as_bool),
+        help="Perbarui metrik dan data terbaru secara otomatis"
+    )
+    live_interval = st.number_input(
+        "Interval refresh (detik):",
+        min_value=2,
+        max_value=300,
+        value=get_setting("LIVE_INTERVAL", 10, int),
+        disabled=not live_mode
+    )
+
+run_every = live_interval if live_mode else None
+
+# ===== MAIN DASHBOARD =====
+st.markdown("---")
+st.fragment(run_every=run_every)(render_metrics)()
+st.markdown("---")
+st.fragment(run_every=run_every)(render_recent_records)()
@@ -0,0 +1,453 @@
+"""Shared MongoDB data access for all dashboard pages.
+
+Every page goes through this module instead of holding its own client, so
+a process serves all sessions from one pooled `MongoClient` and the status
+queries live in one place. While rollup.py keeps the hourly buckets
+synced, the stats and trend queries read those instead of the raw collection.
+The home page stats and recent records go through a single-flight cache
+(cache.py) so a TTL expiry costs one query, not one per session.
+"""
+import datetime
+import logging
+
+import pandas as pd
+from pymongo import MongoClient, DESCENDING
+from pymongo.errors import PyMongoError
+
+import columnar
+import metrics
+from cache import LRUCache, single_flight
+from config import get_setting, as_bool
+
+logger = logging.getLogger(__name__)
+
+# ===== SCHEMA =====
+# Canonical status stored in `status_code` (backfilled by migrate_status.py)
+STATUS_UNKNOWN = 0
+STATUS_COMPLIANT = 1
+STATUS_VIOLATION = 2
+
+STATUS_CODES = {
+    "compliant": STATUS_COMPLIANT,
+    "violation": STATUS_VIOLATION,
+}
+
+# Both legacy schema generations of `helmet_status`, kept as a fallback
+# for documents that have no `status_code` yet
+COMPLIANT_STATUSES = ["helmet", "compliant"]
+VIOLATION_STATUSES = ["no_helmet", "violation"]
+
+STATUS_VALUES = {
+    "compliant": COMPLIANT_STATUSES,
+    "violation": VIOLATION_STATUSES,
+}
+
+LEGACY_STATUS_CODES = {
+    **dict.fromkeys(COMPLIANT_STATUSES, STATUS_COMPLIANT),
+    **dict.fromkeys(VIOLATION_STATUSES, STATUS_VIOLATION),
+}
+
+# Aggregation expression giving the status code of a document
+STATUS_CODE_EXPR = {"$ifNull": ["$status_code", {"$cond": [
+    {"$in": ["$helmet_status", COMPLIANT_STATUSES]},
+    STATUS_COMPLIANT,
+    {"$cond": [{"$in": ["$helmet_status", VIOLATION_STATUSES]}, STATUS_VIOLATION, STATUS_UNKNOWN]}
+]}]}
+
+# Counters stored in every hourly rollup bucket
+ROLLUP_COUNT_FIELDS = ("uploaded", "unprocessed", "processed", "compliant", "violation")
+ROLLUP_STATE_ID = "hourly"
+# Bucket for documents without a usable date: counted in the totals, never in a trend
+ROLLUP_UNDATED = "undated"
+# Seconds a dashboard process may keep reading rollups after they are taken down
+ROLLUP_STATE_TTL = 60
+
+# Sort order shared by the recent records and the paged table
+NEWEST_FIRST = [("uploaded_at", DESCENDING), ("_id", DESCENDING)]
+
+# Slim per-row summary behind the Detail Data table, with column kinds
+# (see columnar.py); image URLs and other detail fields are fetched by
+# _id only for the rows that need them
+RECORD_SCHEMA = {
+    "_id": "objectid",
+    "filename": "string",
+    "uploaded_at": "datetime",
+    "helmet_status": "string",
+    "status_code": "int",
+    "confidence": "float",
+}
+
+# Full document behind the detail panel, gallery and prefetch
+DETAIL_PROJECTION = {
+    "filename": 1,
+    "uploaded_at": 1,
+    "processed_at": 1,
+    "helmet_status": 1,
+    "status_code": 1,
+    "confidence": 1,
+    "url": 1,
+    "blob_url": 1,
+}
+
+RECENT_SCHEMA = {
+    "filename": "string",
+    "uploaded_at": "datetime",
+    "helmet_status": "string",
+    "status_code": "int",
+}
+
+
+# ===== CONNECTION =====
+@metrics.cache_resource()
+def get_client() -> MongoClient:
+    """Create the process-wide pooled MongoDB client (shared by all sessions)"""
+    client = MongoClient(
+        get_setting("COSMOSDB_CONN_STRING"),
+        maxPoolSize=get_setting("MONGO_MAX_POOL_SIZE", 50, int),
+        minPoolSize=get_setting("MONGO_MIN_POOL_SIZE", 0, int),
+        maxIdleTimeMS=get_setting("MONGO_MAX_IDLE_TIME_MS", 300000, int),
+        connectTimeoutMS=get_setting("MONGO_CONNECT_TIMEOUT_MS", 10000, int),
+        serverSelectionTimeoutMS=get_setting("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000, int),
+        socketTimeoutMS=get_setting("MONGO_SOCKET_TIMEOUT_MS", 30000, int),
+    )
+    metrics.start_file_exporter()
+    if get_setting("ENSURE_INDEXES", True, as_bool):
+        from indexes import ensure_indexes  # indexes imports db for its canonical queries
+        try:
+            ensure_indexes(client[_database_name()][_collection_name()])
+        except PyMongoError as e:
+            # A read-only credential or a throttled createIndex must not take every page down
+            logger.warning("Could not ensure indexes (%s); run `python indexes.py ensure` with write access", e)
+    return client
+
+
+def _database_name() -> str:
+    return get_setting("MONGO_DATABASE", "image_database")
+
+
+def _collection_name() -> str:
+    return get_setting("MONGO_COLLECTION", "image_metadata")
+
+
+def get_database():
+    """Return the dashboard database on the shared client"""
+    return get_client()[_database_name()]
+
+
+def get_collection():
+    """Return the image metadata collection on the shared client"""
+    return get_database()[_collection_name()]
+
+
+def get_rollup_collection():
+    """Return the hourly rollup buckets maintained by rollup.py"""
+    return get_database()[get_setting("ROLLUP_COLLECTION", "image_metadata_hourly")]
+
+
+def get_rollup_state_collection():
+    """Return the collection holding rollup watermarks and the sync lease"""
+    return get_database()["rollup_state"]
+
+
+@metrics.cache_resource()
+def get_detail_cache() -> LRUCache:
+    """Per-_id detail documents shared by all sessions of this process"""
+    return LRUCache(
+        "record_details",
+        max_entries=get_setting("DETAIL_CACHE_SIZE", 5000, int),
+        ttl=get_setting("DETAIL_CACHE_TTL", 300, float),
+    )
+
+
+@metrics.cache_data(ttl=ROLLUP_STATE_TTL)
+def rollup_synced_at() -> datetime.datetime | None:
+    """When rollup.py last finished a sync, or None when rollups are off or not built"""
+    if not get_setting("USE_ROLLUPS", True, as_bool):
+        return None
+    with metrics.timed("db", "rollup_synced_at"):
+        state = get_rollup_state_collection().find_one(
+            {"_id": ROLLUP_STATE_ID}, {"built_at": 1, "synced_at": 1}
+        )
+    if not state or not state.get("built_at"):
+        return None
+    return state.get("synced_at") or state["built_at"]
+
+
+def rollup_age(synced_at: datetime.datetime | None) -> float | None:
+    """Seconds since `synced_at` (a rollup_synced_at result), None when that is None"""
+    if synced_at is None:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return (now - synced_at).total_seconds()
+
+
+def rollup_is_fresh(age: float | None) -> bool:
+    """True when the rollups are built and their age is within ROLLUP_MAX_AGE seconds"""
+    return age is not None and age <= get_setting("ROLLUP_MAX_AGE", 900, float)
+
+
+def rollups_ready() -> bool:
+    """True when the rollups are built and fresh enough to answer the queries.
+
+    A stopped rollup.py sync would otherwise freeze the stats and trends,
+    so stale buckets fall back to aggregating the raw collection.
+    """
+    return rollup_is_fresh(rollup_age(rollup_synced_at()))
+
+
+# ===== QUERIES =====
+def status_query(status: str | None) -> dict:
+    """Filter for a canonical status ('compliant', 'violation') or None for all"""
+    if status is None:
+        return {}
+    code = STATUS_CODES[status]
+    # Once every writer sets status_code the filter is a plain equality match
+    if get_setting("STATUS_CODE_ONLY", False, as_bool):
+        return {"status_code": code}
+    return {"$or": [
+        {"status_code": code},
+        {"status_code": {"$exists": False}, "helmet_status": {"$in": STATUS_VALUES[status]}},
+    ]}
+
+
+def resolve_status_code(record: dict) -> int:
+    """Status code of a record, falling back to its legacy helmet_status"""
+    code = record.get("status_code")
+    if code is None:
+        code = LEGACY_STATUS_CODES.get(record.get("helmet_status"), STATUS_UNKNOWN)
+    return code
+
+
+def resolve_status_codes(frame):
+    """Vectorized resolve_status_code over a fetched DataFrame (int8)"""
+    legacy = frame["helmet_status"].map(LEGACY_STATUS_CODES)
+    codes = frame["status_code"].astype("float64").fillna(legacy.astype("float64"))
+    return codes.fillna(STATUS_UNKNOWN).astype("int8")
+
+
+def _shape_records(frame):
+    """Resolve the status and drop the raw legacy field"""
+    frame["status_code"] = resolve_status_codes(frame)
+    return frame.drop(columns=["helmet_status"])
+
+
+def build_filter_query(
+    status: str | None = None,
+    date: datetime.date | None = None,
+    until: datetime.date | None = None,
+) -> dict:
+    """Build the filter for the Detail Data status and date selectors.
+
+    `date` alone selects one day; with `until` it selects the inclusive
+    range of days from `date` to `until`.
+    """
+    query = status_query(status)
+
+    if date:
+        start_date = datetime.datetime.combine(date, datetime.time.min)
+        end_date = datetime.datetime.combine(until or date, datetime.time.max)
+        query["uploaded_at"] = {"$gte": start_date, "$lte": end_date}
+
+    return query
+
+
+def stats_filters() -> dict[str, dict]:
+    """Filter of every stats count but the total; each is answered from an index"""
+    return {
+        "processed": {"processed": True},
+        "helmet": {"processed": True, **status_query("compliant")},
+        "no_helmet": {"processed": True, **status_query("violation")},
+    }
+
+
+@single_flight("STATS_CACHE_TTL", 60)
+def get_database_stats() -> dict[str, int]:
+    """Fetch total, processed, compliant and violation counts"""
+    if rollups_ready():
+        return _rollup_stats()
+
+    collection = get_collection()
+    # Separate index-backed counts: a single $facet reads every document
+    with metrics.timed("db", "get_database_stats"):
+        stats = {"total": collection.estimated_document_count()}
+        for name, query in stats_filters().items():
+            stats[name] = collection.count_documents(query)
+    return stats
+
+
+@single_flight("RECENT_CACHE_TTL", 60)
+def get_recent_records(limit: int = 10) -> pd.DataFrame:
+    """Fetch the `limit` most recent records regardless of status, as a typed DataFrame"""
+    with metrics.timed("db", "get_recent_records") as span:
+        frame = columnar.find_frame(get_collection(), {}, RECENT_SCHEMA, NEWEST_FIRST, limit)
+        span.documents = len(frame)
+    return _shape_records(frame)
+
+
+def keyset_query(cursor: tuple) -> dict:
+    """Match the rows strictly after `cursor` in NEWEST_FIRST order"""
+    last_uploaded_at, last_id = cursor
+    # A null or missing uploaded_at sorts after every date when descending
+    if last_uploaded_at is None:
+        return {"uploaded_at": None, "_id": {"$lt": last_id}}
+    return {
+        "$or": [
+            {"uploaded_at": {"$lt": last_uploaded_at}},
+            {"uploaded_at": last_uploaded_at, "_id": {"$lt": last_id}},
+            {"uploaded_at": None},
+        ]
+    }
+
+
+def records_page_query(status: str | None, date: datetime.date | None, cursor: tuple | None) -> dict:
+    """Filter of a records page: the status and date selectors, after `cursor`"""
+    query = build_filter_query(status, date)
+    if cursor is not None:
+        keyset = keyset_query(cursor)
+        query = {"$and": [query, keyset]} if query else keyset
+    return query
+
+
+@single_flight("RECORDS_CACHE_TTL", 30, "RECORDS_CACHE_MB", 256)
+def get_records_page(
+    status: str | None = None,
+    date: datetime.date | None = None,
+    limit: int = 100,
+    cursor: tuple | None = None,
+) -> tuple[pd.DataFrame, bool]:
+    """Fetch one page of records, newest first, starting after `cursor`.
+
+    `cursor` is the (uploaded_at, _id) pair of the last row on the previous
+    page (see page_cursor). Returns (records, has_next), where records is a
+    typed DataFrame with the RECORD_SCHEMA columns.
+    """
+    query = records_page_query(status, date, cursor)
+
+    # Fetch one extra row to detect a next page
+    with metrics.timed("db", "get_records_page") as span:
+        frame = columnar.find_frame(get_collection(), query, RECORD_SCHEMA, NEWEST_FIRST, limit + 1)
+        span.documents = len(frame)
+
+    return _shape_records(frame.iloc[:limit].copy()), len(frame) > limit
+
+
+def page_cursor(records: pd.DataFrame) -> tuple:
+    """Keyset cursor (uploaded_at, _id) after the last row of a records page"""
+    last = records.iloc[-1]
+    uploaded_at = last["uploaded_at"]
+    return (None if pd.isna(uploaded_at) else uploaded_at.to_pydatetime(), last["_id"])
+
+
+def get_record_details(ids: list) -> dict:
+    """{_id: detail document} for `ids`, fetching only uncached ones, in one query"""
+    cache = get_detail_cache()
+    found = cache.get_many(ids)
+    missing = [record_id for record_id in ids if record_id not in found]
+    if missing:
+        with metrics.timed("db", "get_record_details") as span:
+            documents = list(get_collection().find({"_id": {"$in": missing}}, DETAIL_PROJECTION))
+            span.documents = len(documents)
+        fetched = {}
+        for doc in documents:
+            doc["url"] = doc.get("url") or doc.get("blob_url")
+            fetched[doc["_id"]] = doc
+        cache.put_many(fetched)
+        found.update(fetched)
+    return found
+
+
+def get_record_detail(record_id) -> dict | None:
+    """Detail document of one record, or None if it no longer exists"""
+    return get_record_details([record_id]).get(record_id)
+
+
+def _violation_window(since: datetime.date | None) -> dict:
+    """Match violations with a processed_at on or after `since`"""
+    if since is None:
+        processed_at = {"$type": "date"}
+    else:
+        processed_at = {"$gte": datetime.datetime.combine(since, datetime.time.min)}
+    return {**status_query("violation"), "processed_at": processed_at}
+
+
+def daily_violations_pipeline(since: datetime.date | None = None) -> list[dict]:
+    return [
+        {"$match": _violation_window(since)},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$processed_at"}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def hourly_violations_pipeline(since: datetime.date | None = None) -> list[dict]:
+    return [
+        {"$match": _violation_window(since)},
+        {"$group": {"_id": {"$hour": "$processed_at"}, "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+@single_flight("TRENDS_CACHE_TTL", 60)
+def get_daily_violations(since: datetime.date | None = None) -> list[dict]:
+    """Count violations per processed_at day, one row per day with data"""
+    if rollups_ready():
+        return _rollup_violations(since, {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id"}}, "date")
+    
+    with metrics.timed("db", "get_daily_violations") as span:
+        rows = [
+            {"date": row["_id"], "count": row["count"]}
+            for row in get_collection().aggregate(daily_violations_pipeline(since))
+        ]
+        span.documents = len(rows)
+    return rows
+
+
+@single_flight("TRENDS_CACHE_TTL", 60)
+def get_hourly_violations(since: datetime.date | None = None) -> list[dict]:
+    """Count violations per hour of day of processed_at (at most 24 rows)"""
+    if rollups_ready():
+        return _rollup_violations(since, {"$hour": "$_id"}, "hour")
+    
+    with metrics.timed("db", "get_hourly_violations") as span:
+        rows = [
+            {"hour": row["_id"], "count": row["count"]}
+            for row in get_collection().aggregate(hourly_violations_pipeline(since))
+        ]
+        span.documents = len(rows)
+    return rows
+
+
+# ===== ROLLUP READERS =====
+# Buckets are keyed by UTC hour, so these touch O(hours) tiny documents
+def _rollup_stats() -> dict[str, int]:
+    pipeline = [
+        {"$group": {"_id": None, **{field: {"$sum": f"${field}"} for field in ROLLUP_COUNT_FIELDS}}}
+    ]
+    with metrics.timed("db", "rollup_stats"):
+        totals = next(get_rollup_collection().aggregate(pipeline), {})
+    return {
+        'total': totals.get('uploaded', 0),
+        'processed': totals.get('processed', 0),
+        'helmet': totals.get('compliant', 0),
+        'no_helmet': totals.get('violation', 0),
+    }
+
+
+def _rollup_violations(since: datetime.date | None, group_key: dict, name: str) -> list[dict]:
+    match = {"violation": {"$gt": 0}, "_id": {"$type": "date"}}
+    if since is not None:
+        match["_id"] = {"$gte": datetime.datetime.combine(since, datetime.time.min)}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": group_key, "count": {"$sum": "$violation"}}},
+        {"$sort": {"_id": 1}},
+    ]
+    with metrics.timed("db", f"rollup_violations_{name}") as span:
+        rows = [
+            {name: row["_id"], "count": row["count"]}
+            for row in get_rollup_collection().aggregate(pipeline)
+        ]
+        span.documents = len(rows)
+    return rows
@@ -0,0 +1,306 @@
+"""Streaming exports of filtered detections.
+
+Rows are read from a batched MongoDB cursor and written straight to a
+temporary CSV or Parquet file one batch at a time, so memory stays flat
+no matter how many rows match. Evidence images are downloaded on a
+bounded thread pool and streamed into a ZIP archive as they arrive. When EXPORT_CONTAINER is set the finished
+file is uploaded there and handed out as a SAS link, keeping large files
+out of the Streamlit server's memory as well.
+
+Without an export container the page serves the file itself, and
+Streamlit holds a download in memory while serving it. Local exports are
+therefore kept small: a ZIP takes at most EXPORT_LOCAL_MAX_IMAGES images
+(default 500) instead of EXPORT_MAX_IMAGES, and a file larger than
+EXPORT_LOCAL_MAX_MB (default 200) is not offered for download.
+
+Temporary files live in EXPORT_DIR and are swept once they are older than
+EXPORT_FILE_TTL seconds, so exports abandoned by closed sessions do not
+pile up on disk.
+"""
+import csv
+import datetime
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import db
+import storage
+from config import get_setting
+
+EXPORT_FIELDS = ["_id", "filename", "uploaded_at", "processed_at", "helmet_status", "status_code", "confidence", "url"]
+
+EXPORT_PROJECTION = {
+    "filename": 1,
+    "uploaded_at": 1,
+    "processed_at": 1,
+    "helmet_status": 1,
+    "status_code": 1,
+    "confidence": 1,
+    "url": 1,
+    "blob_url": 1,
+}
+
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+ZIP_MIME = "application/zip"
+
+MB = 1024 * 1024
+
+
+def export_dir():
+    """Directory holding the temporary export files"""
+    directory = get_setting("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "helmet-dashboard-exports"))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def sweep_exports():
+    """Delete temporary export files older than EXPORT_FILE_TTL seconds"""
+    cutoff = time.time() - get_setting("EXPORT_FILE_TTL", 3600, float)
+    for entry in os.scandir(export_dir()):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass  # removed concurrently by another session's sweep
+
+
+def _temp_file(prefix, suffix):
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=export_dir())
+    os.close(fd)
+    return path
+
+
+def read_export(path):
+    """Bytes of a finished export file, read only when the download is requested"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def can_publish():
+    """True when finished exports go to EXPORT_CONTAINER and are handed out as SAS links"""
+    return bool(get_setting("EXPORT_CONTAINER")) and storage.can_sign_sas()
+
+
+def image_limit():
+    """Most images a ZIP export holds; lower when the page has to serve the ZIP itself"""
+    if can_publish():
+        return get_setting("EXPORT_MAX_IMAGES", 10000, int)
+    return get_setting("EXPORT_LOCAL_MAX_IMAGES", 500, int)
+
+
+def servable(path):
+    """True when a local export file is small enough for the page to serve"""
+    return os.path.getsize(path) <= get_setting("EXPORT_LOCAL_MAX_MB", 200, float) * MB
+
+
+def count_rows(query):
+    return db.get_collection().count_documents(query)
+
+
+def iter_batches(query, batch_size=5000):
+    """Yield lists of export rows (dicts with EXPORT_FIELDS), newest first"""
+    cursor = (
+        db.get_collection()
+        .find(query, EXPORT_PROJECTION)
+        .sort(db.NEWEST_FIRST)
+        .batch_size(batch_size)
+    )
+    batch = []
+    for doc in cursor:
+        batch.append({
+            "_id": str(doc["_id"]),
+            "filename": doc.get("filename"),
+            "uploaded_at": doc.get("uploaded_at"),
+            "processed_at": doc.get("processed_at"),
+            "helmet_status": doc.get("helmet_status"),
+            "status_code": db.resolve_status_code(doc),
+            "confidence": doc.get("confidence"),
+            "url": doc.get("url") or doc.get("blob_url"),
+        })
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _write_csv(batches, path, progress):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+            progress(rows)
+    return rows
+
+
+def _write_parquet(batches, path, progress):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("_id", pa.string()),
+        ("filename", pa.string()),
+        ("uploaded_at", pa.timestamp("ms")),
+        ("processed_at", pa.timestamp("ms")),
+        ("helmet_status", pa.string()),
+        ("status_code", pa.int8()),
+        ("confidence", pa.float64()),
+        ("url", pa.string()),
+    ])
+    rows = 0
+    # One row group per batch: only the current batch is held in memory
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            columns = {name: [row[name] for row in batch] for name in EXPORT_FIELDS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(batch)
+            progress(rows)
+    return rows
+
+
+def export_to_file(query, fmt, progress=lambda rows: None):
+    """Write every row matching `query` to a temp file; returns (path, rows)"""
+    extension, _ = FORMATS[fmt]
+    sweep_exports()
+    path = _temp_file("export_", f".{extension}")
+
+    batches = iter_batches(query, get_setting("EXPORT_BATCH_SIZE", 5000, int))
+    writer = _write_csv if fmt == "CSV" else _write_parquet
+    try:
+        rows = writer(batches, path, progress)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
+
+
+def _fetch_image(row):
+    """Download one evidence image; returns (row, bytes or None, error)"""
+    if not row["url"]:
+        return row, None, "no image url"
+    try:
+        # Reuse an already cached copy, but do not fill the cache with bulk downloads
+        data = storage.get_image_cache().get(row["url"])
+        if data is None:
+            data, _ = storage.download_blob(row["url"])
+        return row, data, ""
+    except Exception as e:
+        return row, None, str(e)
+
+
+def export_images_zip(query, progress=lambda rows: None):
+    """Write the images matching `query` plus a manifest.csv into a temp ZIP.
+
+    At most image_limit() rows are included. Downloads run on
+    EXPORT_WORKERS threads with at most twice that many in flight, so
+    memory holds only a handful of images at a time. Returns
+    (path, rows, failed).
+    """
+    workers = get_setting("EXPORT_WORKERS", 16, int)
+    max_images = image_limit()
+
+    sweep_exports()
+    path = _temp_file("export_", ".zip")
+    manifest_path = _temp_file("manifest_", ".csv")
+
+    rows = failed = 0
+    names = set()
+
+    def store(archive, manifest, future):
+        nonlocal rows, failed
+        row, data, error = future.result()
+        zip_path = ""
+        if data is not None:
+            _, blob_name = storage.parse_blob_url(row["url"])
+            zip_path = f"images/{blob_name}"
+            if zip_path in names:
+                zip_path = f"images/{row['_id']}_{blob_name}"
+            names.add(zip_path)
+            # Images are already compressed
+            archive.writestr(zip_path, data, compress_type=zipfile.ZIP_STORED)
+        else:
+            failed += 1
+        manifest.writerow({**row, "zip_path": zip_path, "error": error})
+        rows += 1
+        progress(rows)
+
+    try:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive, \
+                open(manifest_path, "w", newline="", encoding="utf-8") as manifest_file, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            manifest = csv.DictWriter(manifest_file, fieldnames=EXPORT_FIELDS + ["zip_path", "error"])
+            manifest.writeheader()
+
+            pending = set()
+            submitted = 0
+            for batch in iter_batches(query, batch_size=min(500, max_images)):
+                for row in batch[:max_images - submitted]:
+                    while len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            store(archive, manifest, future)
+                    pending.add(pool.submit(_fetch_image, row))
+                    submitted += 1
+                if submitted >= max_images:
+                    break
+            for future in wait(pending).done:
+                store(archive, manifest, future)
+
+            manifest_file.flush()
+            archive.write(manifest_path, "manifest.csv")
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        os.remove(manifest_path)
+
+    return path, rows, failed
+
+
+def publish(path, file_name, content_type):
+    """Upload a finished file to EXPORT_CONTAINER and return its blob name.
+
+    Returns None when no export container is configured or SAS signing is
+    unavailable; the caller then serves the file itself.
+    """
+    if not can_publish():
+        return None
+    container = get_setting("EXPORT_CONTAINER")
+
+    from azure.storage.blob import ContentSettings
+
+    # Unique prefix so concurrent exports with the same name never collide
+    blob_name = f"{uuid.uuid4().hex[:12]}/{file_name}"
+    blob_client = storage.get_blob_service_client().get_blob_client(container=container, blob=blob_name)
+    with open(path, "rb") as f:
+        # Streams from disk in chunks
+        blob_client.upload_blob(
+            f,
+            overwrite=True,
+            content_settings=ContentSettings(
+                content_type=content_type,
+                content_disposition=f'attachment; filename="{file_name}"'
+            )
+        )
+    return blob_name
+
+
+def download_link(blob_name):
+    """SAS link to a published export, re-signed whenever it nears expiry"""
+    return storage.get_sas_url(get_setting("EXPORT_CONTAINER"), blob_name)
+
+
+def export_file_name(prefix, fmt):
+    extension, _ = FORMATS[fmt]
+    return f"{prefix}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
@@ -0,0 +1,36 @@
+"""Display formatting shared by the dashboard tables."""
+import numpy as np
+import pandas as pd
+
+import db
+
+STATUS_LABELS = {
+    db.STATUS_COMPLIANT: 'Patuh ✅',
+    db.STATUS_VIOLATION: 'Melanggar ❌',
+}
+
+
+def status_labels(df):
+    """Categorical display label per row from the resolved status_code; anything not compliant shows as a violation"""
+    compliant = df['status_code'].to_numpy() == db.STATUS_COMPLIANT
+    labels = [STATUS_LABELS[db.STATUS_COMPLIANT], STATUS_LABELS[db.STATUS_VIOLATION]]
+    return pd.Series(
+        pd.Categorical.from_codes(np.where(compliant, 0, 1), categories=labels),
+        index=df.index
+    )
+
+
+def date_and_time(values):
+    """('YYYY-MM-DD', 'HH:MM:SS') string columns for a datetime column, 'N/A' where missing"""
+    stamps = pd.Series(
+        np.datetime_as_string(values.to_numpy(dtype='datetime64[s]')),
+        index=values.index
+    )
+    missing = values.isna()
+    return stamps.str[:10].mask(missing, 'N/A'), stamps.str[11:19].mask(missing, 'N/A')
+
+
+def percentages(values):
+    """'87.5%' per fraction, 'N/A' where missing"""
+    text = (values.astype('float64') * 100).round(1).astype(str) + '%'
+    return text.mask(values.isna(), 'N/A')
@@ -0,0 +1,180 @@
+"""Two-tier byte cache for blob images.
+
+An in-memory LRU bounded by total bytes sits in front of an on-disk cache
+with size-based eviction. Entries are keyed by blob URL and remember the
+blob's ETag, which storage.load_image_bytes revalidates against the blob;
+thumbnails remember the ETag of the original they were made from.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryLRU:
+    """Thread-safe LRU of (etag, bytes, stored at) entries bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[key] = (etag, data, time.monotonic())
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """Directory of cached files, evicting least recently used past `max_bytes`.
+
+    Each file holds the ETag on its first line followed by the raw bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # path -> (last access, size), rebuilt from what is already on disk
+        self._index = {}
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".bin"):
+                stat = entry.stat()
+                self._index[entry.path] = (stat.st_mtime, stat.st_size)
+        self.size = sum(size for _, size in self._index.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".bin")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                etag = f.readline()[:-1].decode()
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            if path in self._index:
+                self._index[path] = (os.path.getmtime(path), self._index[path][1])
+        return etag, data
+
+    def put(self, key, etag, data):
+        path = self._path(key)
+        payload = (etag or "").encode() + b"\n" + data
+        if len(payload) > self.max_bytes:
+            return
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._index.pop(path, None)
+            if old is not None:
+                self.size -= old[1]
+            self._index[path] = (os.path.getmtime(path), len(payload))
+            self.size += len(payload)
+            self._evict()
+
+    def _evict(self):
+        if self.size <= self.max_bytes:
+            return
+        for path, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._index[path]
+            self.size -= size
+            if self.size <= self.max_bytes:
+                break
+
+    def __len__(self):
+        return len(self._index)
+
+
+class ImageCache:
+    """Memory LRU in front of a disk cache, with hit/miss counters"""
+
+    def __init__(self, memory_max_bytes, disk_dir, disk_max_bytes):
+        self.memory = MemoryLRU(memory_max_bytes)
+        self.disk = DiskCache(disk_dir, disk_max_bytes) if disk_dir else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, key):
+        """(etag, bytes, age) for `key`, or None.
+
+        `age` is the seconds since a memory entry was stored or last
+        confirmed current; entries read from disk have age None.
+        """
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._count("memory_hits")
+            return entry[0], entry[1], time.monotonic() - entry[2]
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._count("disk_hits")
+                return entry[0], entry[1], None
+
+        self._count("misses")
+        return None
+
+    def get(self, key):
+        """Return cached bytes for `key`, or None"""
+        entry = self.lookup(key)
+        return None if entry is None else entry[1]
+
+    def confirm(self, key, data, etag):
+        """Record that the cached bytes still match the blob (refreshes the memory entry)"""
+        self.memory.put(key, etag, data)
+
+    def put(self, key, data, etag=None):
+        self.memory.put(key, etag, data)
+        if self.disk is not None:
+            self.disk.put(key, etag, data)
+
+    def stats(self):
+        """Counters and sizes for display"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "disk_bytes": self.disk.size if self.disk is not None else 0,
+        }
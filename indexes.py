@@ -0,0 +1,159 @@
+"""Indexes behind the dashboard queries, and a check that they are used.
+
+`ensure_indexes` creates every declared index idempotently; db.get_client
+runs it at startup unless ENSURE_INDEXES=false. The check mode runs
+`explain()` on each canonical dashboard query and reports collection
+scans and in-memory sorts, so a query regression shows up before the
+Cosmos RU bill does.
+
+Usage:
+    python indexes.py ensure
+    python indexes.py check     # exits 1 when a query is not index-backed
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+import db
+
+# Index names are left to MongoDB's defaults so existing indexes with the
+# same keys are recognised instead of conflicting.
+INDEXES = [
+    # Recent records, paged table and exports: newest first + keyset cursor
+    IndexModel([("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+    # Status-filtered pages: one index per branch of the status $or
+    IndexModel([("status_code", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("helmet_status", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+    # Trend aggregations: status + processed_at window
+    IndexModel([("status_code", ASCENDING), ("processed_at", ASCENDING)]),
+    IndexModel([("helmet_status", ASCENDING), ("processed_at", ASCENDING)]),
+    # Rollup sync: processed_at watermark scan
+    IndexModel([("processed_at", ASCENDING)]),
+    # Stats counts: processed flag, then both branches of the status $or
+    IndexModel([("processed", ASCENDING), ("status_code", ASCENDING), ("helmet_status", ASCENDING)]),
+]
+
+
+def ensure_indexes(collection):
+    """Create all declared indexes; a no-op for the ones that already exist"""
+    return collection.create_indexes(INDEXES)
+
+
+# ===== EXPLAIN CHECK =====
+def canonical_queries():
+    """(name, kind, spec) for each query the pages run against the raw collection"""
+    today = datetime.date.today()
+    month_ago = today - datetime.timedelta(days=29)
+    midnight = datetime.datetime.combine(today, datetime.time.min)
+    # Keyset cursor of a later page: the last row of the previous one
+    cursor = (midnight, ObjectId.from_datetime(midnight))
+
+    def page(status=None, date=None, cursor=None):
+        return {"filter": db.records_page_query(status, date, cursor), "sort": db.NEWEST_FIRST, "limit": 101}
+
+    def count(query):
+        return {"filter": query, "sort": None, "limit": 0}
+
+    return [
+        ("recent records", "find", {"filter": {}, "sort": db.NEWEST_FIRST, "limit": 10}),
+        *[(f"stats: {name}", "find", count(query)) for name, query in db.stats_filters().items()],
+        ("page: all", "find", page()),
+        ("page: violations", "find", page("violation")),
+        ("page: compliant", "find", page("compliant")),
+        ("page: one day", "find", page(None, today)),
+        ("page 2+: all", "find", page(cursor=cursor)),
+        ("page 2+: violations", "find", page("violation", cursor=cursor)),
+        ("page 2+: one day", "find", page(None, today, cursor)),
+        ("daily violations (30 days)", "aggregate", {"pipeline": db.daily_violations_pipeline(month_ago)}),
+        ("hourly violations (30 days)", "aggregate", {"pipeline": db.hourly_violations_pipeline(month_ago)}),
+        ("rollup watermark scan", "find", count({"processed": True, "processed_at": {"$gt": midnight}})),
+    ]
+
+
+def explain(collection, kind, spec):
+    if kind == "find":
+        cursor = collection.find(spec["filter"]).limit(spec["limit"])
+        if spec["sort"]:
+            cursor = cursor.sort(spec["sort"])
+        return cursor.explain()
+    return collection.database.command(
+        "aggregate", collection.name, pipeline=spec["pipeline"], explain=True
+    )
+
+
+def _stages(node):
+    """Every plan stage name found anywhere in an explain document"""
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            yield node["stage"]
+        for value in node.values():
+            yield from _stages(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _stages(value)
+
+
+def _winning_plans(node):
+    """Winning plans only, so rejected candidate plans are not reported"""
+    if isinstance(node, dict):
+        if "winningPlan" in node:
+            yield node["winningPlan"]
+        for key, value in node.items():
+            if key not in ("winningPlan", "rejectedPlans"):
+                yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _winning_plans(value)
+
+
+def plan_problems(explain_output):
+    """Problems in a query plan: collection scans and blocking in-memory sorts"""
+    plans = list(_winning_plans(explain_output)) or [explain_output]
+    stages = {stage for plan in plans for stage in _stages(plan)}
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("collection scan")
+    if "SORT" in stages:
+        problems.append("in-memory sort")
+    return problems
+
+
+def check(collection):
+    """Explain every canonical query; returns {name: problems}"""
+    report = {}
+    for name, kind, spec in canonical_queries():
+        try:
+            report[name] = plan_problems(explain(collection, kind, spec))
+        except Exception as e:
+            report[name] = [f"explain failed: {e}"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage and verify dashboard indexes")
+    parser.add_argument("command", choices=["ensure", "check"])
+    args = parser.parse_args()
+
+    if args.command == "check":
+        # Check the indexes as deployed, without creating missing ones first
+        os.environ.setdefault("ENSURE_INDEXES", "false")
+    collection = db.get_collection()
+
+    if args.command == "ensure":
+        for name in ensure_indexes(collection):
+            print(f"ok  {name}")
+        return
+
+    report = check(collection)
+    for name, problems in report.items():
+        print(f"{'FAIL' if problems else 'ok  '}  {name}" + (f": {', '.join(problems)}" if problems else ""))
+    if any(report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
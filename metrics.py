@@ -0,0 +1,264 @@
+"""Process-wide timing and cache metrics for the dashboard.
+
+Pages and data modules wrap database calls, blob downloads, DataFrame
+builds and chart builds in `timed(kind, name)`; cached data functions use
+`cache_data` from here so calls and misses are counted. Everything lands
+in one registry per process, shown on the Diagnostik page and rendered in
+Prometheus text format, optionally written to METRICS_FILE for a textfile
+collector.
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from config import get_setting
+
+# Latency histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Upper bucket bound below which a fraction `q` of observations fall"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return 0.0
+
+
+class Registry:
+    """Histograms and counters keyed by (metric name, sorted label pairs)"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, labels, value):
+        key = self._key(name, labels)
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    def inc(self, name, labels, amount=1):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, name, labels):
+        return self.counters.get(self._key(name, labels), 0)
+
+
+REGISTRY = Registry()
+
+# Callables returning {metric name: value}, sampled at export time
+GAUGE_SOURCES = []
+
+
+def register_gauges(source):
+    """Add a callable whose {name: value} gauges are included in every export"""
+    GAUGE_SOURCES.append(source)
+
+
+class Span:
+    """Extra facts a timed block can report"""
+
+    def __init__(self):
+        self.documents = None
+        self.bytes = None
+
+
+@contextmanager
+def timed(kind, name):
+    """Time a block as `kind` (db, blob, image, dataframe, chart) / `name`"""
+    span = Span()
+    labels = {"kind": kind, "name": name}
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception:
+        REGISTRY.inc("dashboard_operation_errors_total", labels)
+        raise
+    finally:
+        REGISTRY.observe("dashboard_operation_duration_seconds", labels, time.perf_counter() - start)
+        if span.documents is not None:
+            REGISTRY.inc("dashboard_documents_total", labels, span.documents)
+        if span.bytes is not None:
+            REGISTRY.inc("dashboard_bytes_total", labels, span.bytes)
+
+
+def _counted_cache(st_cache, cache_type, name, cache_kwargs):
+    def decorator(func):
+        labels = {"cache": name or func.__name__, "type": cache_type}
+
+        @functools.wraps(func)
+        def miss(*args, **kwargs):
+            REGISTRY.inc("dashboard_cache_misses_total", labels)
+            return func(*args, **kwargs)
+
+        cached = st_cache(**cache_kwargs)(miss)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            REGISTRY.inc("dashboard_cache_calls_total", labels)
+            return cached(*args, **kwargs)
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+
+def cache_data(name=None, **cache_kwargs):
+    """`st.cache_data` that also counts calls and misses"""
+    return _counted_cache(st.cache_data, "data", name, cache_kwargs)
+
+
+def cache_resource(name=None, **cache_kwargs):
+    """`st.cache_resource` that also counts calls and misses"""
+    return _counted_cache(st.cache_resource, "resource", name, cache_kwargs)
+
+
+# ===== REPORTING =====
+def operation_summary():
+    """Rows of count / latency / documents / bytes per timed operation"""
+    rows = []
+    with REGISTRY._lock:
+        histograms = dict(REGISTRY.histograms)
+    for (metric, labels), hist in sorted(histograms.items()):
+        if metric != "dashboard_operation_duration_seconds":
+            continue
+        labels = dict(labels)
+        rows.append({
+            "kind": labels["kind"],
+            "name": labels["name"],
+            "count": hist.count,
+            "mean_ms": round(hist.sum / hist.count * 1000, 1) if hist.count else 0.0,
+            "p50_ms": hist.quantile(0.5) * 1000,
+            "p95_ms": hist.quantile(0.95) * 1000,
+            "errors": REGISTRY.counter("dashboard_operation_errors_total", labels),
+            "documents": REGISTRY.counter("dashboard_documents_total", labels),
+            "bytes": REGISTRY.counter("dashboard_bytes_total", labels),
+        })
+    return rows
+
+
+def cache_summary():
+    """Rows of calls / misses / hit rate per counted cache"""
+    rows = []
+    with REGISTRY._lock:
+        counters = dict(REGISTRY.counters)
+    for (metric, labels), calls in sorted(counters.items()):
+        if metric != "dashboard_cache_calls_total":
+            continue
+        misses = counters.get(("dashboard_cache_misses_total", labels), 0)
+        waits = counters.get(("dashboard_cache_waits_total", labels), 0)
+        labels = dict(labels)
+        rows.append({
+            "cache": labels["cache"],
+            "type": labels["type"],
+            "calls": calls,
+            "misses": misses,
+            "waits": waits,
+            "hit_rate": round(1 - misses / calls, 3) if calls else 0.0,
+        })
+    return rows
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def gauges():
+    """Current values of all registered gauges"""
+    values = {}
+    for source in GAUGE_SOURCES:
+        values.update(source())
+    return values
+
+
+def prometheus_text():
+    """Render the registry and the registered gauges in Prometheus text format"""
+    lines = []
+    with REGISTRY._lock:
+        histograms = dict(REGISTRY.histograms)
+        counters = dict(REGISTRY.counters)
+
+    for metric in sorted({metric for metric, _ in histograms}):
+        lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), hist in sorted(histograms.items()):
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {hist.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {hist.count}")
+
+    for metric in sorted({metric for metric, _ in counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    for name, value in sorted(gauges().items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    """Atomically write the Prometheus text to `path`"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+@cache_resource()
+def start_file_exporter():
+    """Write METRICS_FILE every METRICS_FILE_INTERVAL seconds (once per process)"""
+    path = get_setting("METRICS_FILE")
+    if not path:
+        return None
+    interval = get_setting("METRICS_FILE_INTERVAL", 15, int)
+
+    def loop():
+        while True:
+            try:
+                write_metrics_file(path)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="metrics-file-exporter", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,84 @@
+"""Backfill the canonical `status_code` field from the legacy helmet_status.
+
+Walks the collection in `_id` order with batched `bulk_write` updates and
+records the last `_id` it finished in rollup_state, so an interrupted run
+continues where it stopped. Documents that are still unprocessed have no
+status yet; rerun with --restart (or on a schedule next to the rollup
+sync) until the detection worker writes `status_code` itself, then set
+STATUS_CODE_ONLY=true.
+
+Usage:
+    python migrate_status.py
+    python migrate_status.py --batch-size 500 --pause 0.5   # gentler on RUs
+    python migrate_status.py --restart                      # rescan from the start
+"""
+import argparse
+import time
+
+from pymongo import UpdateOne
+
+import db
+
+MIGRATION_ID = "status_code_backfill"
+
+
+def migrate(batch_size=1000, pause=0.0, restart=False):
+    """Backfill status_code in batches; returns the number of documents updated"""
+    collection = db.get_collection()
+    state = db.get_rollup_state_collection()
+
+    if restart:
+        state.delete_one({"_id": MIGRATION_ID})
+    last_id = (state.find_one({"_id": MIGRATION_ID}) or {}).get("last_id")
+
+    updated = 0
+    while True:
+        query = {
+            "status_code": {"$exists": False},
+            "helmet_status": {"$in": list(db.LEGACY_STATUS_CODES)},
+        }
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(
+            collection.find(query, {"helmet_status": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne(
+                # Never overwrite a code written by the detection worker meanwhile
+                {"_id": doc["_id"], "status_code": {"$exists": False}},
+                {"$set": {"status_code": db.LEGACY_STATUS_CODES[doc["helmet_status"]]}},
+            )
+            for doc in batch
+        ]
+        result = collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+        last_id = batch[-1]["_id"]
+        state.update_one({"_id": MIGRATION_ID}, {"$set": {"last_id": last_id}}, upsert=True)
+        print(f"Updated {updated} documents (last _id {last_id})")
+
+        if pause:
+            time.sleep(pause)
+
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill status_code from helmet_status")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--restart", action="store_true", help="forget the saved position and rescan")
+    args = parser.parse_args()
+
+    updated = migrate(args.batch_size, args.pause, args.restart)
+    print(f"Done, {updated} documents updated")
+
+
+if __name__ == "__main__":
+    main()
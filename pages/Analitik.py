@@ -1,10 +1,6 @@
 import streamlit as st
-from pymongo import MongoClient
-import pandas as pd
 import datetime
 from datetime import timedelta
-import plotly.express as px
-import plotly.graph_objects as go
 
 st.set_page_config(
     page_title="Helmet Detection Dashboard | Analitik",
@@ -30,6 +26,15 @@ with st.sidebar:
 
 # ===== END LOGIN CHECK =====
 
+# Deferred imports (see dashboard.py)
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import metrics
+import refresher
+import replica
+
 # Custom CSS for compact layout
 st.markdown("""
     <style>
@@ -91,28 +96,25 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Connect to database
+# Trend window options in days (None = all data)
+TREND_WINDOWS = {
+    "7 hari terakhir": 7,
+    "30 hari terakhir": 30,
+    "90 hari terakhir": 90,
+    "1 tahun terakhir": 365,
+    "Semua": None,
+}
+
+
+# Load data
 try:
-    client = MongoClient(st.secrets["COSMOSDB_CONN_STRING"])
-    collection = client["image_database"]["image_metadata"]
+    # Each query reads Cosmos or the local replica, per ANALYTICS_SOURCE
+    stats, stats_source = replica.query("stats")
+    sources = {stats_source}
     
-    # Get stats
-    total = collection.count_documents({})
-    processed = collection.count_documents({"processed": True})
-    
-    # Support both old and new schema
-    helmet = collection.count_documents({
-        "$or": [
-            {"helmet_status": "helmet"},
-            {"helmet_status": "compliant"}
-        ]
-    })
-    no_helmet = collection.count_documents({
-        "$or": [
-            {"helmet_status": "no_helmet"},
-            {"helmet_status": "violation"}
-        ]
-    })
+    processed = stats['processed']
+    helmet = stats['helmet']
+    no_helmet = stats['no_helmet']
     
     # Calculate compliance rate
     compliance_rate = (helmet / processed * 100) if processed > 0 else 0
@@ -127,88 +129,94 @@ try:
     with col_chart1:
         if processed > 0:
             # Compact Pie Chart
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=['Patuh (Pakai Helm)', 'Melanggar (Tidak Pakai Helm)'],
-                values=[helmet, no_helmet],
-                hole=0.4,
-                marker=dict(colors=['#2ecc71', '#e74c3c']),
-                textinfo='label+percent',
-                textfont=dict(size=11)
-            )])
+            with metrics.timed("chart", "compliance_pie"):
+                fig_pie = go.Figure(data=[go.Pie(
+                    labels=['Patuh (Pakai Helm)', 'Melanggar (Tidak Pakai Helm)'],
+                    values=[helmet, no_helmet],
+                    hole=0.4,
+                    marker=dict(colors=['#2ecc71', '#e74c3c']),
+                    textinfo='label+percent',
+                    textfont=dict(size=11)
+                )])
             
-            fig_pie.update_layout(
-                title=dict(text="Distribusi Kepatuhan", font=dict(size=14)),
-                showlegend=True,
-                height=250,  # Reduced from 350
-                margin=dict(t=40, b=10, l=10, r=10),
-                legend=dict(font=dict(size=10))
-            )
+                fig_pie.update_layout(
+                    title=dict(text="Distribusi Kepatuhan", font=dict(size=14)),
+                    showlegend=True,
+                    height=250,  # Reduced from 350
+                    margin=dict(t=40, b=10, l=10, r=10),
+                    legend=dict(font=dict(size=10))
+                )
             
-            st.plotly_chart(fig_pie, use_container_width=True)
+                st.plotly_chart(fig_pie, use_container_width=True)
         else:
             st.info("Belum ada data untuk ditampilkan")
     
     with col_chart2:
         if processed > 0:
             # Compact Gauge Chart
-            fig_gauge = go.Figure(go.Indicator(
-                mode="gauge+number",
-                value=compliance_rate,
-                domain={'x': [0, 1], 'y': [0, 1]},
-                title={'text': "Tingkat Kepatuhan", 'font': {'size': 14}},
-                number={'suffix': '%', 'font': {'size': 30}},
-                gauge={
-                    'axis': {'range': [None, 100], 'ticksuffix': '%', 'tickfont': {'size': 10}},
-                    'bar': {'color': "#2ecc71" if compliance_rate >= 80 else "#f39c12" if compliance_rate >= 60 else "#e74c3c"},
-                    'steps': [
-                        {'range': [0, 60], 'color': "#ffe6e6"},
-                        {'range': [60, 80], 'color': "#fff8e6"},
-                        {'range': [80, 100], 'color': "#e6ffe6"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 3},
-                        'thickness': 0.75,
-                        'value': 80
+            with metrics.timed("chart", "compliance_gauge"):
+                fig_gauge = go.Figure(go.Indicator(
+                    mode="gauge+number",
+                    value=compliance_rate,
+                    domain={'x': [0, 1], 'y': [0, 1]},
+                    title={'text': "Tingkat Kepatuhan", 'font': {'size': 14}},
+                    number={'suffix': '%', 'font': {'size': 30}},
+                    gauge={
+                        'axis': {'range': [None, 100], 'ticksuffix': '%', 'tickfont': {'size': 10}},
+                        'bar': {'color': "#2ecc71" if compliance_rate >= 80 else "#f39c12" if compliance_rate >= 60 else "#e74c3c"},
+                        'steps': [
+                            {'range': [0, 60], 'color': "#ffe6e6"},
+                            {'range': [60, 80], 'color': "#fff8e6"},
+                            {'range': [80, 100], 'color': "#e6ffe6"}
+                        ],
+                        'threshold': {
+                            'line': {'color': "red", 'width': 3},
+                            'thickness': 0.75,
+                            'value': 80
+                        }
                     }
-                }
-            ))
+                ))
             
-            fig_gauge.update_layout(
-                height=250,  # Reduced from 350
-                margin=dict(t=40, b=10, l=10, r=10)
-            )
+                fig_gauge.update_layout(
+                    height=250,  # Reduced from 350
+                    margin=dict(t=40, b=10, l=10, r=10)
+                )
             
-            st.plotly_chart(fig_gauge, use_container_width=True)
+                st.plotly_chart(fig_gauge, use_container_width=True)
         else:
             st.info("Belum ada data untuk ditampilkan")
     
     st.markdown("---")
     
     # === ROW 2: TREND ANALYSIS (COMPACT) ===
-    st.subheader("📈 Trend & Analisis Temporal")
+    col_trend_title, col_trend_window = st.columns([3, 1])
     
-    # Get all violators with timestamps
-    violators = list(collection.find({
-        "$or": [
-            {"helmet_status": "no_helmet"},
-            {"helmet_status": "violation"}
-        ]
-    }))
+    with col_trend_title:
+        st.subheader("📈 Trend & Analisis Temporal")
     
-    if len(violators) > 0:
-        df_violators = pd.DataFrame(violators)
+    with col_trend_window:
+        trend_window = st.selectbox(
+            "Rentang waktu:",
+            options=list(TREND_WINDOWS),
+            index=1
+        )
+    
+    # Counts are grouped in the database: one row per day, at most 24 per hour
+    window_days = TREND_WINDOWS[trend_window]
+    since = datetime.date.today() - timedelta(days=window_days - 1) if window_days else None
+    daily_rows, daily_source = replica.query("daily_violations", since)
+    hourly_rows, hourly_source = replica.query("hourly_violations", since)
+    sources.update((daily_source, hourly_source))
+    
+    if len(daily_rows) > 0:
+        col_trend1, col_trend2 = st.columns([2, 1])
         
-        if 'processed_at' in df_violators.columns:
-            df_violators['processed_at'] = pd.to_datetime(df_violators['processed_at'])
-            df_violators['date'] = df_violators['processed_at'].dt.date
-            df_violators['hour'] = df_violators['processed_at'].dt.hour
-            
-            col_trend1, col_trend2 = st.columns([2, 1])
+        with col_trend1:
+            # Compact Daily trend
+            with metrics.timed("chart", "daily_trend"):
+                daily_violations = pd.DataFrame(daily_rows)
+                daily_violations['date'] = pd.to_datetime(daily_violations['date'])
             
-            with col_trend1:
-                # Compact Daily trend
-                daily_violations = df_violators.groupby('date').size().reset_index(name='count')
-                
                 fig_trend = px.line(
                     daily_violations,
                     x='date',
@@ -217,12 +225,12 @@ try:
                     labels={'date': 'Tanggal', 'count': 'Jumlah Pelanggar'},
                     markers=True
                 )
-                
+            
                 fig_trend.update_traces(
                     line=dict(color='#e74c3c', width=2),
                     marker=dict(size=6)
                 )
-                
+            
                 fig_trend.update_layout(
                     height=250,  # Reduced from 400
                     hovermode='x unified',
@@ -232,13 +240,14 @@ try:
                     xaxis=dict(title=dict(font=dict(size=11)), tickfont=dict(size=10)),
                     yaxis=dict(title=dict(font=dict(size=11)), tickfont=dict(size=10))
                 )
-                
+            
                 st.plotly_chart(fig_trend, use_container_width=True)
+        
+        with col_trend2:
+            # Compact Hourly distribution
+            with metrics.timed("chart", "hourly_distribution"):
+                hourly_violations = pd.DataFrame(hourly_rows)
             
-            with col_trend2:
-                # Compact Hourly distribution
-                hourly_violations = df_violators.groupby('hour').size().reset_index(name='count')
-                
                 fig_hour = px.bar(
                     hourly_violations,
                     x='hour',
@@ -248,7 +257,7 @@ try:
                     color='count',
                     color_continuous_scale='Reds'
                 )
-                
+            
                 fig_hour.update_layout(
                     height=250,  # Reduced from 400
                     showlegend=False,
@@ -257,10 +266,8 @@ try:
                     margin=dict(t=40, b=40, l=40, r=10),
                     title=dict(font=dict(size=14))
                 )
-                
+            
                 st.plotly_chart(fig_hour, use_container_width=True)
-        else:
-            st.warning("Data timestamp tidak tersedia untuk analisis trend")
     else:
         st.info("Belum ada data pelanggaran")
     
@@ -270,7 +277,16 @@ try:
     with footer_col1:
         st.caption(f"🕐 Terakhir diperbarui: {datetime.datetime.now().strftime('%d %B %Y, %H:%M:%S')}")
     with footer_col2:
-        st.caption("💾 Data source: Azure CosmosDB")
+        if sources == {"cosmos"}:
+            st.caption("💾 Data source: Azure CosmosDB")
+            refresher.show_rollup_age()
+        else:
+            replica_synced_at = replica.synced_at()
+            synced_text = f"{replica_synced_at:%d %B %Y, %H:%M:%S} UTC" if replica_synced_at else "N/A"
+            st.caption(f"💾 Data source: Replika lokal (sinkron terakhir: {synced_text})")
+
+    if "replica_fallback" in sources:
+        st.warning("⚠️ Azure CosmosDB tidak dapat dijangkau, menampilkan data replika lokal (read-only).")
 
 
 except Exception as e:
@@ -1,10 +1,7 @@
-import streamlit as st
-from pymongo import MongoClient
-import pandas as pd
 import datetime
-from PIL import Image
-from io import BytesIO
-from azure.storage.blob import BlobServiceClient
+import os
+
+import streamlit as st
 
 st.set_page_config(
     page_title="Helmet Detection Dashboard | Detail Data",
@@ -30,6 +27,17 @@ with st.sidebar:
 
 # ===== END LOGIN CHECK =====
 
+# Deferred imports (see dashboard.py)
+import pandas as pd
+
+import db
+import formatting
+import metrics
+import export
+import prefetch
+import storage
+import thumbnails
+
 # Custom CSS for layout
 st.markdown("""
     <style>
@@ -104,79 +112,33 @@ st.markdown("""
 st.title("📋 Detail Data Deteksi Helm")
 
 
-# ===== DATABASE CONNECTION =====
-@st.cache_resource
-def init_connection():
-    return MongoClient(st.secrets["COSMOSDB_CONN_STRING"])
+# Status selector labels mapped to the canonical status names used by db
+STATUS_OPTIONS = {
+    "Semua": None,
+    "Patuh (Pakai Helm)": "compliant",
+    "Melanggar (Tidak Pakai Helm)": "violation",
+}
 
 
-@st.cache_resource
-def init_blob_client():
-    """Initialize Azure Blob Storage client with authentication"""
-    return BlobServiceClient.from_connection_string(
-        st.secrets["AZURE_STORAGE_CONNECTION_STRING"]
-    )
+# Thumbnails per row in gallery mode
+GALLERY_COLUMNS = 5
+# Thumbnails rendered per rerun; larger pages are split into gallery sections
+GALLERY_PAGE_SIZE = 50
 
-
-@st.cache_data(ttl=30)
-def get_all_records(status_filter="Semua", date_filter=None, limit=100):
-    """Fetch all records with filters"""
-    client = init_connection()
-    collection = client["image_database"]["image_metadata"]
-    
-    # Build query
-    query = {}
-    
-    # Status filter
-    if status_filter == "Patuh (Pakai Helm)":
-        query["helmet_status"] = {"$in": ["helmet", "compliant"]}
-    elif status_filter == "Melanggar (Tidak Pakai Helm)":
-        query["helmet_status"] = {"$in": ["no_helmet", "violation"]}
-    
-    # Date filter
-    if date_filter:
-        start_date = datetime.datetime.combine(date_filter, datetime.time.min)
-        end_date = datetime.datetime.combine(date_filter, datetime.time.max)
-        query["uploaded_at"] = {"$gte": start_date, "$lte": end_date}
-    
-    # Fetch ALL records first, then sort in Python
-    records = list(collection.find(query))
-    
-    # Sort in Python by uploaded_at (newest first)
-    records_sorted = sorted(
-        records, 
-        key=lambda x: x.get('uploaded_at', datetime.datetime.min),
-        reverse=True
-    )
-    
-    # Apply limit after sorting to get newest records
-    return records_sorted[:limit]
+# Rows before and after the selection whose previews are prefetched
+PREFETCH_NEIGHBOURS = 3
 
 
 def load_image_from_blob(blob_url):
-    """Load image from Azure Blob Storage with authentication"""
+    """Detail-panel image: a SAS URL when enabled, else preview bytes via the shared cache"""
     try:
-        # Get blob client
-        blob_service_client = init_blob_client()
-        
-        # Extract container and blob name from URL
-        # Example URL: https://storagetugas.blob.core.windows.net/photo/photo_20251113_171531_427061.jpg
-        parts = blob_url.split('/')
-        container_name = parts[-2]  # 'photo'
-        blob_name = parts[-1]        # 'photo_20251113_171531_427061.jpg'
-        
-        # Get blob client for specific blob
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=blob_name
-        )
-        
-        # Download blob data
-        blob_data = blob_client.download_blob().readall()
-        
-        # Convert to PIL Image
-        img = Image.open(BytesIO(blob_data))
-        return img
+        if storage.sas_enabled():
+            try:
+                preview_size = thumbnails.THUMBNAIL_SIZES["preview"]
+                return thumbnails.thumbnail_sas_url(blob_url, preview_size) or storage.get_image_sas_url(blob_url)
+            except Exception:
+                pass  # fall back to proxying the bytes
+        return prefetch.get_preview_prefetcher().load(blob_url)
     except Exception as e:
         st.error(f"Error loading image: {str(e)}")
         return None
@@ -189,7 +151,7 @@ with st.expander("🔍 Filter Data", expanded=True):
     with col_filter1:
         status_filter = st.selectbox(
             "Status Kepatuhan",
-            ["Semua", "Patuh (Pakai Helm)", "Melanggar (Tidak Pakai Helm)"],
+            list(STATUS_OPTIONS),
             index=0
         )
 
@@ -203,6 +165,7 @@ with st.expander("🔍 Filter Data", expanded=True):
     with col_filter3:
         if st.button("🔄 Refresh Data", use_container_width=True):
             st.cache_data.clear()
+            db.get_records_page.clear()
             st.rerun()
 
     # Add limit selector and pagination
@@ -214,86 +177,260 @@ with st.expander("🔍 Filter Data", expanded=True):
             options=limit_options,
             index=1,  # Default to 100
         )
+    with col_limit2:
+        view_mode = st.radio(
+            "Tampilan:",
+            ["Tabel", "Galeri"],
+            horizontal=True
+        )
     
     # Initialize page number in session state
     if 'current_page' not in st.session_state:
         st.session_state.current_page = 1
+        st.session_state.page_cursors = [None]
+
+    # Any filter change starts again from the first page
+    filter_key = (status_filter, date_filter, data_limit)
+    if st.session_state.get('filter_key') != filter_key:
+        st.session_state.filter_key = filter_key
+        st.session_state.current_page = 1
+        st.session_state.page_cursors = [None]
+        st.session_state.pop('selected_id', None)
+        st.session_state.pop('gallery_page', None)
+        # Prefetches for the old result set are no longer useful
+        prefetch.Prefetcher.cancel(st.session_state.pop('prefetch_futures', []))
+
+
+# ===== EXPORT =====
+with st.expander("📤 Ekspor Data", expanded=False):
+    col_export1, col_export2, col_export3 = st.columns([2, 1, 1])
+    
+    with col_export1:
+        export_range = st.date_input(
+            "Rentang Tanggal",
+            value=(date_filter, date_filter) if date_filter else (),
+            help="Kosongkan untuk mengekspor semua tanggal. Status mengikuti filter di atas."
+        )
+    
+    with col_export2:
+        export_format = st.radio("Format", list(export.FORMATS), horizontal=True)
+    
+    with col_export3:
+        start_export = st.button("📤 Mulai Ekspor", use_container_width=True)
+        start_zip = st.button("🗜️ Unduh Gambar (ZIP)", use_container_width=True)
+    
+    if start_export or start_zip:
+        # Remove this session's previous export file
+        previous = st.session_state.pop('export_result', None)
+        if previous and previous['path'] and os.path.exists(previous['path']):
+            os.remove(previous['path'])
+        
+        try:
+            query = db.build_filter_query(STATUS_OPTIONS[status_filter], *export_range[:2])
+            total_rows = export.count_rows(query)
+            image_limit = export.image_limit() if start_zip else None
+            if start_zip and total_rows > image_limit:
+                st.info(f"ℹ️ ZIP dibatasi {image_limit:,} gambar terbaru dari {total_rows:,} baris")
+                total_rows = image_limit
+            progress_bar = st.progress(0.0, text="Menyiapkan ekspor...")
+            
+            def update_progress(rows):
+                progress_bar.progress(
+                    min(rows / total_rows, 1.0) if total_rows else 1.0,
+                    text=f"{rows:,} / {total_rows:,} baris"
+                )
+            
+            failed = 0
+            if start_zip:
+                path, rows, failed = export.export_images_zip(query, update_progress)
+                file_name = f"gambar_deteksi_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+                mime = export.ZIP_MIME
+            else:
+                path, rows = export.export_to_file(query, export_format, update_progress)
+                file_name = export.export_file_name("deteksi_helm", export_format)
+                mime = export.FORMATS[export_format][1]
+            
+            blob_name = export.publish(path, file_name, mime)
+            too_large = not blob_name and not export.servable(path)
+            if blob_name or too_large:
+                os.remove(path)
+                path = None
+            
+            st.session_state['export_result'] = {
+                'file_name': file_name,
+                'mime': mime,
+                'rows': rows,
+                'failed': failed,
+                'blob_name': blob_name,
+                'path': path,
+                'too_large': too_large,
+            }
+        except Exception as e:
+            st.error(f"⚠️ Ekspor gagal: {str(e)}")
+    
+    export_result = st.session_state.get('export_result')
+    if export_result:
+        st.success(f"✅ {export_result['rows']:,} baris siap diunduh")
+        if export_result['failed']:
+            st.warning(f"⚠️ {export_result['failed']:,} gambar gagal diunduh (lihat manifest.csv)")
+        if export_result['blob_name']:
+            # Signed on every render, so the link never outlives its SAS token
+            st.link_button("📥 Unduh File", export.download_link(export_result['blob_name']))
+        elif export_result['path'] and os.path.exists(export_result['path']):
+            # Read only when clicked, so the file never sits in server memory between reruns
+            st.download_button(
+                label="📥 Unduh File",
+                data=lambda path=export_result['path']: export.read_export(path),
+                file_name=export_result['file_name'],
+                mime=export_result['mime'],
+                on_click="ignore"
+            )
+        elif export_result['too_large']:
+            st.warning("⚠️ File terlalu besar untuk diunduh langsung; persempit rentang tanggal atau atur EXPORT_CONTAINER.")
+        else:
+            st.info("ℹ️ File ekspor sudah kedaluwarsa, silakan ekspor ulang.")
 
 st.markdown("---")
 
 
 # ===== MAIN LAYOUT: TABLE (3/4) + DETAIL PANEL (1/4) =====
 try:
-    # Fetch data
-    records = get_all_records(
-        status_filter=status_filter,
-        date_filter=date_filter if date_filter else None,
-        limit=data_limit
+    # Fetch current page
+    records, has_next = db.get_records_page(
+        status=STATUS_OPTIONS[status_filter],
+        date=date_filter if date_filter else None,
+        limit=data_limit,
+        cursor=st.session_state.page_cursors[-1]
     )
     
+    # Pagination controls
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅️ Sebelumnya", use_container_width=True, disabled=st.session_state.current_page <= 1):
+            st.session_state.page_cursors.pop()
+            st.session_state.current_page -= 1
+            st.session_state.pop('selected_id', None)
+            st.session_state.pop('gallery_page', None)
+            st.rerun()
+    with col_page:
+        st.markdown(f"<p style='text-align: center; margin-top: 0.5rem;'>Halaman {st.session_state.current_page}</p>", unsafe_allow_html=True)
+    with col_next:
+        if st.button("Berikutnya ➡️", use_container_width=True, disabled=not has_next):
+            st.session_state.page_cursors.append(db.page_cursor(records))
+            st.session_state.current_page += 1
+            st.session_state.pop('selected_id', None)
+            st.session_state.pop('gallery_page', None)
+            st.rerun()
+    
     if len(records) > 0:
-        # Convert to DataFrame
-        df = pd.DataFrame(records)
-        
-        # Prepare display columns
-        df['No'] = range(1, len(df) + 1)
-        
-        # Format datetime
-        if 'uploaded_at' in df.columns:
-            df['Tanggal'] = pd.to_datetime(df['uploaded_at']).dt.strftime('%Y-%m-%d')
-            df['Waktu'] = pd.to_datetime(df['uploaded_at']).dt.strftime('%H:%M:%S')
-        else:
-            df['Tanggal'] = 'N/A'
-            df['Waktu'] = 'N/A'
-        
-        # Status mapping
-        df['Status'] = df['helmet_status'].apply(
-            lambda x: 'Patuh ✅' if x in ['helmet', 'compliant'] else 'Melanggar ❌'
-        )
-        
-        # Format confidence rate (as percentage)
-        if 'confidence' in df.columns:
-            df['Confidence'] = df['confidence'].apply(
-                lambda x: f"{x*100:.1f}%" if pd.notna(x) else 'N/A'
-            )
-        else:
-            df['Confidence'] = 'N/A'
-        
-        # Display columns with confidence
-        display_df = df[['No', 'Tanggal', 'Waktu', 'filename', 'Confidence', 'Status']].copy()
-        display_df.columns = ['No', 'Tanggal', 'Waktu', 'Nama File', 'Confidence', 'Status']
+        with metrics.timed("dataframe", "records_page"):
+            # Display columns (numbered across pages), formatted column-wise
+            first_no = (st.session_state.current_page - 1) * data_limit + 1
+            tanggal, waktu = formatting.date_and_time(records['uploaded_at'])
+            display_df = pd.DataFrame({
+                'No': range(first_no, first_no + len(records)),
+                'Tanggal': tanggal,
+                'Waktu': waktu,
+                'Nama File': records['filename'],
+                'Confidence': formatting.percentages(records['confidence']),
+                'Status': formatting.status_labels(records),
+            }, index=records.index)
         
         # Create two columns: Table (3/4) and Detail Panel (1/4)
         col_table, col_detail = st.columns([3, 1])
         
         with col_table:
-            st.subheader(f"📊 Data Kendaraan ({len(records)} data)")
+            st.subheader(f"📊 Data Kendaraan ({len(records)} data, halaman {st.session_state.current_page})")
             
-            # Display table with selection
-            selected_indices = st.dataframe(
-                display_df,
-                use_container_width=True,
-                hide_index=True,
-                height=820,
-                on_select="rerun",
-                selection_mode="single-row"
+            if view_mode == "Galeri":
+                # Thumbnail grid for one section of the current page at a time
+                gallery_pages = max(1, -(-len(records) // GALLERY_PAGE_SIZE))
+                gallery_page = min(st.session_state.get('gallery_page', 1), gallery_pages)
+                if gallery_pages > 1:
+                    gallery_page = st.selectbox(
+                        "Bagian galeri:",
+                        options=range(1, gallery_pages + 1),
+                        index=gallery_page - 1,
+                        format_func=lambda p: (
+                            f"{display_df['No'].iloc[(p - 1) * GALLERY_PAGE_SIZE]}–"
+                            f"{display_df['No'].iloc[min(p * GALLERY_PAGE_SIZE, len(records)) - 1]}"
+                        )
+                    )
+                st.session_state['gallery_page'] = gallery_page
+                gallery_start = (gallery_page - 1) * GALLERY_PAGE_SIZE
+                gallery_end = min(gallery_start + GALLERY_PAGE_SIZE, len(records))
+                
+                page_ids = records['_id'].iloc[gallery_start:gallery_end].tolist()
+                details = db.get_record_details(page_ids)
+                img_urls = [details.get(record_id, {}).get('url') for record_id in page_ids]
+                with st.spinner('Memuat thumbnail...'):
+                    with metrics.timed("blob", "gallery_thumbnails") as span:
+                        thumbs = thumbnails.load_thumbnails(
+                            img_urls,
+                            thumbnails.THUMBNAIL_SIZES["gallery"],
+                            prefer_sas=storage.sas_enabled()
+                        )
+                        span.documents = len(img_urls)
+                
+                for row_start in range(gallery_start, gallery_end, GALLERY_COLUMNS):
+                    gallery_cols = st.columns(GALLERY_COLUMNS)
+                    for idx, gallery_col in zip(range(row_start, gallery_end), gallery_cols):
+                        with gallery_col:
+                            if thumbs[idx - gallery_start]:
+                                st.image(thumbs[idx - gallery_start], use_container_width=True)
+                            else:
+                                st.caption("⚠️ Gambar tidak tersedia")
+                            
+                            label = f"{display_df['No'].iloc[idx]} · {display_df['Status'].iloc[idx]}"
+                            if st.button(label, key=f"gallery_{records['_id'].iloc[idx]}", use_container_width=True):
+                                st.session_state['selected_id'] = records['_id'].iloc[idx]
+            else:
+                # Display table with selection
+                selected_indices = st.dataframe(
+                    display_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    height=820,
+                    on_select="rerun",
+                    selection_mode="single-row"
+                )
+                
+                # Get selected row
+                if selected_indices and len(selected_indices['selection']['rows']) > 0:
+                    selected_idx = selected_indices['selection']['rows'][0]
+                    st.session_state['selected_id'] = records['_id'].iloc[selected_idx]
+        
+        # Warm the cache for rows around the selection (the first rows when nothing is selected).
+        # Not needed with SAS delivery, where the browser fetches images itself.
+        if not storage.sas_enabled():
+            selected_id = st.session_state.get('selected_id')
+            center = next(
+                (idx for idx, record_id in enumerate(records['_id']) if record_id == selected_id),
+                -1
             )
-            
-            # Get selected row
-            if selected_indices and len(selected_indices['selection']['rows']) > 0:
-                selected_idx = selected_indices['selection']['rows'][0]
-                st.session_state['selected_record'] = records[selected_idx]
+            neighbour_ids = [
+                records['_id'].iloc[idx]
+                for idx in prefetch.neighbour_indices(center, len(records), PREFETCH_NEIGHBOURS)
+            ]
+            # One batched lookup for the neighbours' URLs
+            neighbours = db.get_record_details(neighbour_ids)
+            prefetcher = prefetch.get_preview_prefetcher()
+            prefetcher.cancel(st.session_state.get('prefetch_futures', []))
+            st.session_state['prefetch_futures'] = prefetcher.prefetch([
+                neighbours.get(record_id, {}).get('url') for record_id in neighbour_ids
+            ])
         
         with col_detail:
             st.subheader("🔍 Detail Informasi")
             
-            if 'selected_record' in st.session_state and st.session_state['selected_record']:
-                record = st.session_state['selected_record']
-                
+            # Only the _id is kept per session; the document comes from the shared detail cache
+            selected_id = st.session_state.get('selected_id')
+            record = db.get_record_detail(selected_id) if selected_id is not None else None
+            
+            if record:
                 # Display image with authenticated access
-                if 'url' in record or 'blob_url' in record:
-                    img_url = record.get('url') or record.get('blob_url')
-                    
+                img_url = record.get('url')
+                if img_url:
                     with st.spinner('Memuat gambar...'):
                         img = load_image_from_blob(img_url)
                         if img:
@@ -302,8 +439,7 @@ try:
                             st.warning("⚠️ Gambar tidak dapat dimuat")
                 
                 # Status
-                status = record.get('helmet_status', 'unknown')
-                if status in ['helmet', 'compliant']:
+                if db.resolve_status_code(record) == db.STATUS_COMPLIANT:
                     st.markdown('<div class="status-compliant">✅ PATUH</div>', unsafe_allow_html=True)
                 else:
                     st.markdown('<div class="status-violation">❌ MELANGGAR</div>', unsafe_allow_html=True)
@@ -315,23 +451,22 @@ try:
                 st.text(record.get('filename', 'N/A'))
                 
                 st.markdown(f"**📅 Tanggal & Waktu:**")
-                if 'uploaded_at' in record:
-                    upload_time = pd.to_datetime(record['uploaded_at'])
+                if record.get('uploaded_at'):
+                    upload_time = record['uploaded_at']
                     st.text(upload_time.strftime('%d %B %Y'))
                     st.text(upload_time.strftime('%H:%M:%S'))
                 else:
                     st.text('N/A')
                 
                 st.markdown(f"**🎯 Confidence Rate:**")
-                confidence = record.get('confidence', None)
+                confidence = record.get('confidence')
                 if confidence is not None:
                     st.text(f"{confidence*100:.1f}%")
                 else:
                     st.text('N/A')
                 
                 st.markdown(f"**🔗 URL Gambar:**")
-                img_url = record.get('url') or record.get('blob_url', 'N/A')
-                if img_url != 'N/A':
+                if img_url:
                     st.text_input("", img_url, label_visibility="collapsed", disabled=True)
                 else:
                     st.text('N/A')
@@ -0,0 +1,109 @@
+import datetime
+
+import streamlit as st
+
+st.set_page_config(
+    page_title="Helmet Detection Dashboard | Diagnostik",
+    layout="wide",
+    page_icon="logo.png",
+    initial_sidebar_state="collapsed"
+)
+
+# ===== LOGIN CHECK =====
+# Check if user is logged in
+if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    st.error("⚠️ Anda harus login terlebih dahulu!")
+    st.info("👉 Silakan kembali ke halaman Home untuk login.")
+    st.stop()
+
+# Logout button in sidebar
+with st.sidebar:
+    st.markdown(f"### 👤 {st.session_state.username}")
+    if st.button("🚪 Logout", use_container_width=True):
+        st.session_state.logged_in = False
+        st.session_state.username = None
+        st.switch_page("Home.py")
+
+# Diagnostics expose internals of every session in this process
+if st.session_state.username != "admin":
+    st.error("⛔ Halaman ini hanya untuk admin.")
+    st.stop()
+
+# ===== END LOGIN CHECK =====
+
+# Deferred imports (see dashboard.py)
+import pandas as pd
+
+import metrics
+import storage
+from config import get_setting
+
+st.title("🩺 Diagnostik")
+st.caption(
+    "Metrik proses ini sejak server dijalankan: latensi query database, unduhan blob, "
+    "pembuatan DataFrame dan grafik, serta hit rate cache."
+)
+
+if st.button("🔄 Muat ulang"):
+    st.rerun()
+
+# === TIMED OPERATIONS ===
+st.subheader("⏱️ Operasi")
+operations = metrics.operation_summary()
+if operations:
+    st.dataframe(
+        pd.DataFrame(operations),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "mean_ms": st.column_config.NumberColumn("mean (ms)", format="%.1f"),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms, ≤)", format="%.1f"),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms, ≤)", format="%.1f"),
+        }
+    )
+else:
+    st.info("ℹ️ Belum ada operasi yang tercatat")
+
+# === CACHES ===
+st.subheader("🗃️ Cache Data")
+caches = metrics.cache_summary()
+st.caption(f"Backend cache bersama: `{get_setting('CACHE_BACKEND', 'local')}`")
+if caches:
+    st.dataframe(
+        pd.DataFrame(caches),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "hit_rate": st.column_config.ProgressColumn("hit rate", min_value=0.0, max_value=1.0, format="%.2f"),
+        }
+    )
+else:
+    st.info("ℹ️ Belum ada pemanggilan cache")
+
+# === IMAGE CACHE ===
+st.subheader("🖼️ Cache Gambar")
+image_stats = storage.get_image_cache().stats()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Hit rate", f"{image_stats['hit_rate'] * 100:.1f}%")
+col2.metric("Memory hits", f"{image_stats['memory_hits']:,}")
+col3.metric("Disk hits", f"{image_stats['disk_hits']:,}")
+col4.metric("Misses", f"{image_stats['misses']:,}")
+st.caption(
+    f"Memori: {image_stats['memory_entries']:,} gambar, {image_stats['memory_bytes'] / 1024 / 1024:.1f} MB · "
+    f"Disk: {image_stats['disk_entries']:,} gambar, {image_stats['disk_bytes'] / 1024 / 1024:.1f} MB"
+)
+
+# === PROMETHEUS EXPORT ===
+st.subheader("📤 Ekspor Prometheus")
+prometheus = metrics.prometheus_text()
+metrics_file = get_setting("METRICS_FILE")
+if metrics_file:
+    st.caption(f"Ditulis otomatis ke `{metrics_file}` setiap {get_setting('METRICS_FILE_INTERVAL', 15, int)} detik.")
+st.download_button(
+    label="📥 Download metrics.prom",
+    data=prometheus.encode('utf-8'),
+    file_name=f"metrics_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.prom",
+    mime="text/plain"
+)
+with st.expander("Lihat teks"):
+    st.code(prometheus, language="text")
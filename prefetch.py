@@ -0,0 +1,80 @@
+"""Background prefetch of images for neighbouring table rows.
+
+A small shared thread pool warms the image cache ahead of the user. The
+foreground load joins a prefetch already running for the same image
+instead of downloading it a second time.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import thumbnails
+from config import get_setting
+
+
+class Prefetcher:
+    """Bounded-concurrency prefetcher with per-key de-duplication"""
+
+    def __init__(self, loader, max_workers=4):
+        self._loader = loader
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def prefetch(self, keys):
+        """Queue loads for `keys`; returns the futures so the caller can cancel them"""
+        queued = {}
+        with self._lock:
+            for key in keys:
+                if not key or key in self._inflight:
+                    continue
+                future = self._pool.submit(self._loader, key)
+                self._inflight[key] = future
+                queued[key] = future
+        # Outside the lock: a future that already finished runs _forget right here
+        for key, future in queued.items():
+            future.add_done_callback(lambda f, key=key: self._forget(key, f))
+        return list(queued.values())
+
+    def load(self, key):
+        """Load `key` now, reusing a prefetch that is already running"""
+        with self._lock:
+            future = self._inflight.get(key)
+        # A queued prefetch is cancelled and loaded here rather than waited for
+        if future is not None and not future.cancel():
+            try:
+                return future.result()
+            except Exception:
+                pass
+        return self._loader(key)
+
+    @staticmethod
+    def cancel(futures):
+        """Cancel prefetches that have not started yet"""
+        for future in futures:
+            future.cancel()
+
+
+def _load_preview(blob_url):
+    return thumbnails.load_thumbnail(blob_url, thumbnails.THUMBNAIL_SIZES["preview"])
+
+
+@metrics.cache_resource()
+def get_preview_prefetcher():
+    """Prefetcher for detail-panel previews, shared by all sessions"""
+    return Prefetcher(_load_preview, max_workers=get_setting("PREFETCH_WORKERS", 4, int))
+
+
+def neighbour_indices(center, count, k):
+    """Indices of the k rows after and k rows before `center`, nearest first"""
+    indices = []
+    for distance in range(1, k + 1):
+        for idx in (center + distance, center - distance):
+            if 0 <= idx < count:
+                indices.append(idx)
+    return indices
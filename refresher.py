@@ -0,0 +1,118 @@
+"""Stale-while-revalidate snapshots of the home page data.
+
+A background thread recomputes the home page stats, recent records and
+rollup sync time every REFRESH_INTERVAL seconds, well before they would expire. Reruns read
+the latest snapshot without touching the database; only the first request
+of a process waits for the initial load. A failed refresh keeps the last
+good snapshot and records the error for the page to show.
+"""
+import threading
+import time
+
+import streamlit as st
+
+import db
+import metrics
+from config import get_setting
+
+# Recent records are fetched once at the largest page size and sliced per session
+RECENT_RECORDS_MAX = 100
+
+
+class Snapshot:
+    """A loaded value and when it was loaded (epoch seconds)"""
+
+    def __init__(self, value, loaded_at):
+        self.value = value
+        self.loaded_at = loaded_at
+
+    @property
+    def age(self):
+        return time.time() - self.loaded_at
+
+
+class Refresher:
+    """Runs a set of named loaders on a background thread, keeping the last good result"""
+
+    def __init__(self, loaders, interval):
+        self._loaders = loaders
+        self._interval = interval
+        self._snapshots = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._first_pass = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="home-refresher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def refresh(self):
+        """Run every loader once; a failing loader keeps its previous snapshot"""
+        for name, loader in self._loaders.items():
+            try:
+                with metrics.timed("refresh", name):
+                    value = loader()
+            except Exception as e:
+                with self._lock:
+                    self._errors[name] = str(e)
+                continue
+            with self._lock:
+                self._snapshots[name] = Snapshot(value, time.time())
+                self._errors.pop(name, None)
+        self._first_pass.set()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self._interval)
+
+    def get(self, name, timeout=None):
+        """Latest snapshot of `name`, or None if no load has succeeded yet"""
+        self._first_pass.wait(timeout)
+        with self._lock:
+            return self._snapshots.get(name)
+
+    def error(self, name):
+        """Message of the last refresh failure of `name`, if the latest attempt failed"""
+        with self._lock:
+            return self._errors.get(name)
+
+
+def _load_stats():
+    # Reload ahead of the TTL (from the shared cache backend when another
+    # replica already refreshed it, else from the database)
+    return db.get_database_stats.refresh()
+
+
+def _load_recent_records():
+    return db.get_recent_records.refresh(RECENT_RECORDS_MAX)
+
+
+@metrics.cache_resource()
+def get_home_refresher():
+    """Start the home page refresher once per process"""
+    loaders = {
+        "stats": _load_stats,
+        "recent_records": _load_recent_records,
+        "rollup_synced_at": db.rollup_synced_at,
+    }
+    return Refresher(loaders, interval=get_setting("REFRESH_INTERVAL", 30, float)).start()
+
+
+def show_rollup_age():
+    """Caption the age of the hourly rollups, or warn once they are too stale to use.
+
+    Reads the refresher's snapshot, so a database outage never blocks the page here.
+    """
+    snapshot = get_home_refresher().get("rollup_synced_at", timeout=0)
+    age = db.rollup_age(snapshot.value) if snapshot is not None else None
+    if age is None:
+        return
+    if db.rollup_is_fresh(age):
+        st.caption(f"📦 Rollup per jam disinkronkan {age / 60:.0f} menit yang lalu")
+    else:
+        st.warning(
+            f"⚠️ Rollup per jam tidak disinkronkan selama {age / 60:.0f} menit; "
+            "data dihitung langsung dari database."
+        )
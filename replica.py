@@ -0,0 +1,450 @@
+"""Local columnar replica of image_metadata for the Analitik page.
+
+The analytics only need a handful of fields per document, so a sync copies
+those into Parquet files under REPLICA_DIR and the page aggregates them in
+process instead of spending RUs on every view:
+
+    _id           hex string, the key rows are merged on
+    uploaded_at   upload time (naive UTC)
+    processed     whether detection has run
+    processed_at  detection time (naive UTC)
+    status_code   resolved status (legacy helmet_status mapped)
+
+There is one file per UTC day of the `_id` timestamp, which never changes,
+so every document lives in exactly one file. Like rollup.py the sync is
+incremental: documents inserted after the `_id` watermark or processed
+after the `processed_at` watermark are merged into their day's file,
+replacing the older row, and readers aggregate the files as they are. A
+rebuild writes a new generation directory and switches to it, which is
+also the only way deletions and edits that leave processed_at untouched
+reach the replica.
+
+Queries run on DuckDB when it is installed, otherwise on pandas one day
+file at a time (pyarrow reads and writes the Parquet files either way).
+Results are cached per replica version, which every sync bumps.
+ANALYTICS_SOURCE picks where the page reads from:
+
+    cosmos    always query Cosmos (and the rollups)
+    replica   always read the local replica
+    auto      the replica while it is fresher than REPLICA_MAX_AGE seconds,
+              else Cosmos with an ANALYTICS_TIMEOUT budget (default)
+
+In auto mode a failed or timed out Cosmos query is answered from the
+replica, and the following REPLICA_BREAKER_SECONDS of queries go straight
+to the replica instead of waiting on Cosmos again.
+
+Usage:
+    python replica.py sync              # one incremental sync
+    python replica.py sync --every 60   # keep syncing every 60 seconds
+    python replica.py rebuild           # copy everything into a new generation
+"""
+import datetime
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from bson import ObjectId
+
+import columnar
+import db
+import metrics
+import sync_jobs
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "state.json"
+LOCK_FILE = "sync.lock"
+
+SOURCES = ("cosmos", "replica", "auto")
+
+# Fields copied from each document
+SOURCE_FIELDS = ["_id", "uploaded_at", "processed", "processed_at", "status_code", "helmet_status"]
+
+
+class ReplicaUnavailable(Exception):
+    """The replica has not been synced yet"""
+
+
+def _directory():
+    return get_setting("REPLICA_DIR", "replica")
+
+
+def _generation_dir(generation):
+    return os.path.join(_directory(), f"gen-{generation:04d}")
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("_id", pa.string()),
+        ("uploaded_at", pa.timestamp("ms")),
+        ("processed", pa.bool_()),
+        ("processed_at", pa.timestamp("ms")),
+        ("status_code", pa.int8()),
+    ])
+
+
+# ===== STATE =====
+def load_state():
+    """Watermarks, generation and version of the replica ({} before the first sync)"""
+    try:
+        with open(os.path.join(_directory(), STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(state):
+    path = os.path.join(_directory(), STATE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def synced_at(state=None):
+    """When the replica last finished a sync (naive UTC), or None"""
+    state = load_state() if state is None else state
+    if not state.get("synced_at"):
+        return None
+    return datetime.datetime.fromisoformat(state["synced_at"])
+
+
+def is_fresh():
+    """True when the last sync is younger than REPLICA_MAX_AGE seconds"""
+    last = synced_at()
+    max_age = get_setting("REPLICA_MAX_AGE", 300, float)
+    return last is not None and (sync_jobs.now() - last).total_seconds() <= max_age
+
+
+def _day_paths(state):
+    directory = _generation_dir(state["generation"])
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")
+    )
+
+
+# ===== LOCK =====
+def _acquire_lock():
+    """Take the single-writer lock file; False when another sync holds it"""
+    path = os.path.join(_directory(), LOCK_FILE)
+    lease = get_setting("REPLICA_LEASE_SECONDS", 600, int)
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # A lock older than the lease belongs to a sync that died
+            try:
+                if time.time() - os.path.getmtime(path) < lease:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def _release_lock():
+    try:
+        os.remove(os.path.join(_directory(), LOCK_FILE))
+    except FileNotFoundError:
+        pass
+
+
+# ===== SYNC =====
+def _frame(columns):
+    """Replica rows for one batch of decoded documents, plus the day file of each"""
+    days = [oid.generation_time.strftime("%Y-%m-%d") for oid in columns["_id"]]
+    frame = pd.DataFrame(columns, columns=SOURCE_FIELDS)
+    frame["_id"] = frame["_id"].map(str)
+    for field in ("uploaded_at", "processed_at"):
+        frame[field] = pd.to_datetime(frame[field], errors="coerce")
+    frame["processed"] = frame["processed"].map(lambda v: v is True).astype(bool)
+    frame["status_code"] = db.resolve_status_codes(frame)
+    return frame.drop(columns=["helmet_status"]), days
+
+
+def _merge_day(directory, day, rows):
+    """Merge `rows` into the day's file, the new row winning for an _id already there"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = os.path.join(directory, f"{day}.parquet")
+    if os.path.exists(path):
+        rows = pd.concat([pq.read_table(path).to_pandas(), rows], ignore_index=True)
+        rows = rows.drop_duplicates("_id", keep="last")
+    table = pa.Table.from_pandas(rows, schema=_arrow_schema(), preserve_index=False)
+    pq.write_table(table, f"{path}.tmp")
+    # Readers only ever see complete files
+    os.replace(f"{path}.tmp", path)
+
+
+def _write(cursor, directory, batch_size):
+    """Merge the documents of `cursor` into their day files; returns the rows written"""
+    rows = 0
+    while True:
+        columns = columnar.decode(itertools.islice(cursor, batch_size), SOURCE_FIELDS)
+        if not columns["_id"]:
+            return rows
+        frame, days = _frame(columns)
+        # The cursor runs in _id order, so a batch touches only a few days
+        for day, day_rows in frame.groupby(pd.Series(days, index=frame.index), sort=False):
+            _merge_day(directory, day, day_rows)
+        rows += len(frame)
+
+
+def sync(rebuild=False):
+    """Bring the replica up to date; returns the number of rows written"""
+    os.makedirs(_directory(), exist_ok=True)
+    if not _acquire_lock():
+        print("Another replica sync is running, skipping")
+        return 0
+
+    processed_cutoff, id_cutoff = sync_jobs.cutoffs("REPLICA_SETTLE_SECONDS")
+    batch_size = get_setting("REPLICA_BATCH_SIZE", 50000, int)
+
+    try:
+        state = load_state()
+        previous = state.get("generation")
+        rebuild = rebuild or previous is None
+
+        if rebuild:
+            generation = (previous or 0) + 1
+            # Start from an empty directory, even after an interrupted rebuild
+            shutil.rmtree(_generation_dir(generation), ignore_errors=True)
+            query = {"_id": {"$lte": id_cutoff}}
+        else:
+            generation = previous
+            last_processed_at = state.get("last_processed_at")
+            if last_processed_at:
+                last_processed_at = datetime.datetime.fromisoformat(last_processed_at)
+            query = {"$or": [
+                {"_id": sync_jobs.watermark_range(ObjectId(state["last_id"]), id_cutoff)},
+                {"processed_at": sync_jobs.watermark_range(last_processed_at, processed_cutoff)},
+            ]}
+        directory = _generation_dir(generation)
+        os.makedirs(directory, exist_ok=True)
+
+        projection = {field: 1 for field in SOURCE_FIELDS}
+        cursor = db.get_collection().find(query, projection).sort("_id", 1).batch_size(batch_size)
+        with metrics.timed("replica", "sync") as span:
+            rows = _write(cursor, directory, batch_size)
+            span.documents = rows
+
+        state.update(
+            generation=generation,
+            version=state.get("version", 0) + 1,
+            last_id=str(id_cutoff),
+            last_processed_at=processed_cutoff.isoformat(),
+            synced_at=sync_jobs.now().isoformat(),
+        )
+        _save_state(state)
+        if rebuild and previous is not None:
+            shutil.rmtree(_generation_dir(previous), ignore_errors=True)
+    finally:
+        _release_lock()
+
+    return rows
+
+
+# ===== QUERIES =====
+def _version():
+    """Current replica version; raises ReplicaUnavailable before the first sync"""
+    state = load_state()
+    if state.get("generation") is None:
+        raise ReplicaUnavailable("Replika lokal belum disinkronkan (python replica.py sync)")
+    return state["version"]
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+def _sql(sql, params):
+    """Rows of `sql`, where {files} reads every day file of the replica"""
+    paths = _day_paths(load_state())
+    if not paths:
+        return []
+    with _duckdb().connect() as conn:
+        return conn.execute(sql.format(files="read_parquet(?)"), [paths, *params]).fetchall()
+
+
+def _scan(columns):
+    """The replica's `columns`, one day file at a time, so memory holds one day at most"""
+    import pyarrow.parquet as pq
+
+    for path in _day_paths(load_state()):
+        yield pq.read_table(path, columns=columns).to_pandas()
+
+
+def _since(since):
+    return None if since is None else datetime.datetime.combine(since, datetime.time.min)
+
+
+# `version` only keys the result caches: every sync invalidates them
+@metrics.cache_data(max_entries=4)
+def _stats(version):
+    with metrics.timed("replica", "get_database_stats"):
+        if _duckdb() is not None:
+            rows = _sql(f"""
+                SELECT count(*),
+                       count(*) FILTER (WHERE processed),
+                       count(*) FILTER (WHERE processed AND status_code = {db.STATUS_COMPLIANT}),
+                       count(*) FILTER (WHERE processed AND status_code = {db.STATUS_VIOLATION})
+                FROM {{files}}
+            """, [])
+            return rows[0] if rows else (0, 0, 0, 0)
+        totals = [0, 0, 0, 0]
+        for frame in _scan(["processed", "status_code"]):
+            processed = frame["processed"]
+            codes = frame["status_code"]
+            totals[0] += len(frame)
+            totals[1] += int(processed.sum())
+            totals[2] += int((processed & (codes == db.STATUS_COMPLIANT)).sum())
+            totals[3] += int((processed & (codes == db.STATUS_VIOLATION)).sum())
+        return totals
+
+
+def get_database_stats() -> dict[str, int]:
+    """Same counts as db.get_database_stats, from the replica"""
+    row = _stats(_version())
+    return dict(zip(("total", "processed", "helmet", "no_helmet"), (int(v) for v in row)))
+
+
+def _violation_counts(name, select, key, since):
+    """[(group, count)] of violations on or after `since`, grouped by `select` (SQL) / `key` (pandas)"""
+    with metrics.timed("replica", name) as span:
+        if _duckdb() is not None:
+            where = f"status_code = {db.STATUS_VIOLATION} AND processed_at IS NOT NULL"
+            if since is not None:
+                where += " AND processed_at >= ?"
+            rows = _sql(
+                f"SELECT {select}, count(*) FROM {{files}} WHERE {where} GROUP BY 1 ORDER BY 1",
+                [] if since is None else [since],
+            )
+        else:
+            counts = Counter()
+            for frame in _scan(["processed_at", "status_code"]):
+                frame = frame[(frame["status_code"] == db.STATUS_VIOLATION) & frame["processed_at"].notna()]
+                if since is not None:
+                    frame = frame[frame["processed_at"] >= since]
+                counts.update(key(frame["processed_at"]).value_counts().to_dict())
+            rows = sorted(counts.items())
+        span.documents = len(rows)
+    return rows
+
+
+@metrics.cache_data(max_entries=32)
+def _daily(since, version):
+    return _violation_counts(
+        "get_daily_violations", "strftime(processed_at, '%Y-%m-%d')",
+        lambda values: values.dt.strftime("%Y-%m-%d"), since,
+    )
+
+
+@metrics.cache_data(max_entries=32)
+def _hourly(since, version):
+    return _violation_counts("get_hourly_violations", "hour(processed_at)", lambda values: values.dt.hour, since)
+
+
+def get_daily_violations(since: datetime.date | None = None) -> list[dict]:
+    """Same rows as db.get_daily_violations, from the replica"""
+    rows = _daily(_since(since), _version())
+    return [{"date": date, "count": int(count)} for date, count in rows]
+
+
+def get_hourly_violations(since: datetime.date | None = None) -> list[dict]:
+    """Same rows as db.get_hourly_violations, from the replica"""
+    rows = _hourly(_since(since), _version())
+    return [{"hour": int(hour), "count": int(count)} for hour, count in rows]
+
+
+# ===== SOURCE SELECTION =====
+QUERIES = {
+    "stats": (db.get_database_stats, get_database_stats),
+    "daily_violations": (db.get_daily_violations, get_daily_violations),
+    "hourly_violations": (db.get_hourly_violations, get_hourly_violations),
+}
+
+
+class Breaker:
+    """Circuit breaker: once tripped, stays open for `seconds`"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        with self._lock:
+            return time.monotonic() < self._open_until
+
+    def trip(self):
+        with self._lock:
+            self._open_until = time.monotonic() + self.seconds
+
+
+@metrics.cache_resource()
+def get_cosmos_breaker() -> Breaker:
+    """Breaker in front of the Cosmos analytics queries, shared by all sessions"""
+    return Breaker(get_setting("REPLICA_BREAKER_SECONDS", 60, float))
+
+
+@metrics.cache_resource()
+def _cosmos_pool() -> ThreadPoolExecutor:
+    # A query that outruns the budget keeps running here and fills the Cosmos cache
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="analytics-cosmos")
+
+
+def query(name, *args):
+    """(result, source) of an Analitik query, read from where ANALYTICS_SOURCE says.
+
+    `source` is "cosmos", "replica", or "replica_fallback" when Cosmos
+    failed, timed out or is behind an open breaker and the replica
+    answered instead.
+    """
+    remote, local = QUERIES[name]
+    source = get_setting("ANALYTICS_SOURCE", "auto")
+    if source not in SOURCES:
+        raise ValueError(f"Unsupported ANALYTICS_SOURCE: {source}")
+
+    if source == "replica" or (source == "auto" and is_fresh()):
+        return local(*args), "replica"
+    if source == "cosmos" or load_state().get("generation") is None:
+        # Nothing to fall back to
+        return remote(*args), "cosmos"
+
+    breaker = get_cosmos_breaker()
+    if not breaker.is_open():
+        future = _cosmos_pool().submit(remote, *args)
+        try:
+            return future.result(timeout=get_setting("ANALYTICS_TIMEOUT", 5, float)), "cosmos"
+        except Exception as e:
+            breaker.trip()
+            logger.warning("Cosmos query %s failed or timed out (%r); serving the local replica", name, e)
+
+    metrics.REGISTRY.inc("dashboard_replica_fallbacks_total", {"query": name})
+    return local(*args), "replica_fallback"
+
+
+def main():
+    sync_jobs.main("Maintain the local analytics replica", sync, "rows")
+
+
+if __name__ == "__main__":
+    main()
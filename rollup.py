@@ -0,0 +1,278 @@
+"""Hourly compliance rollups of image_metadata.
+
+Each bucket document is keyed by a UTC hour and holds:
+    uploaded     documents whose uploaded_at falls in the hour
+    unprocessed  of those, documents not yet processed
+    processed    documents whose processed_at falls in the hour
+    compliant    of those, documents with a compliant status
+    violation    of those, documents with a violation status
+
+Documents with no uploaded_at, and processed documents with no
+processed_at, are counted in one extra bucket keyed db.ROLLUP_UNDATED, so
+the rollup totals match the raw collection while the trends, which need a
+processed_at, skip it. Dates of any other type are not counted.
+
+The sync is incremental: it finds the hours touched by documents inserted
+after the `_id` watermark or processed after the `processed_at` watermark,
+recounts only those hours and overwrites their buckets, so rerunning a
+sync after a crash is harmless.
+
+Usage:
+    python rollup.py sync              # one incremental sync
+    python rollup.py sync --every 60   # keep syncing every 60 seconds
+    python rollup.py rebuild           # drop all buckets and recount
+
+A rebuild first marks the rollups as not built, so the dashboards answer
+from the raw collection until the recount is done instead of showing
+partial totals.
+"""
+import datetime
+import time
+from collections import defaultdict
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import db
+import sync_jobs
+from config import get_setting
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def _hour_of(field):
+    """Aggregation expression truncating a date field to its UTC hour"""
+    return {"$dateFromParts": {
+        "year": {"$year": f"${field}"},
+        "month": {"$month": f"${field}"},
+        "day": {"$dayOfMonth": f"${field}"},
+        "hour": {"$hour": f"${field}"},
+    }}
+
+
+def _bucket_of(field):
+    """Aggregation expression for the bucket of a date field: its UTC hour, or undated when unset"""
+    return {"$cond": [{"$ifNull": [f"${field}", False]}, _hour_of(field), db.ROLLUP_UNDATED]}
+
+
+def _hour_ranges(hours):
+    """Collapse a set of hours into [start, end) ranges of consecutive hours"""
+    ranges = []
+    for hour in sorted(hours):
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + HOUR
+        else:
+            ranges.append([hour, hour + HOUR])
+    return ranges
+
+
+def _bucket_match(field, buckets, undated):
+    """Match the documents counted in `buckets` of `field`; `undated` matches the undated bucket"""
+    clauses = [
+        {field: {"$gte": start, "$lt": end}}
+        for start, end in _hour_ranges(buckets - {db.ROLLUP_UNDATED})
+    ]
+    if db.ROLLUP_UNDATED in buckets:
+        clauses.append(undated)
+    return {"$or": clauses}
+
+
+# ===== COUNTING =====
+# Documents without an uploaded_at, and processed documents without a
+# processed_at, land in the undated bucket so the totals still add up
+UNDATED_UPLOAD = {"uploaded_at": None}
+UNDATED_PROCESSED = {"processed_at": None}
+
+
+def count_buckets(collection, upload_hours=None, processed_hours=None):
+    """Count bucket values, limited to the given buckets (None = all buckets)"""
+    buckets = defaultdict(lambda: dict.fromkeys(db.ROLLUP_COUNT_FIELDS, 0))
+
+    if upload_hours is None or upload_hours:
+        if upload_hours is None:
+            match = {"$or": [{"uploaded_at": {"$type": "date"}}, UNDATED_UPLOAD]}
+        else:
+            match = _bucket_match("uploaded_at", upload_hours, UNDATED_UPLOAD)
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": _bucket_of("uploaded_at"),
+                "uploaded": {"$sum": 1},
+                "unprocessed": {"$sum": {"$cond": [{"$eq": ["$processed", True]}, 0, 1]}},
+            }},
+        ]
+        for row in collection.aggregate(pipeline, allowDiskUse=True):
+            buckets[row["_id"]].update(uploaded=row["uploaded"], unprocessed=row["unprocessed"])
+
+    if processed_hours is None or processed_hours:
+        match = {"processed": True}
+        if processed_hours is None:
+            match["$or"] = [{"processed_at": {"$type": "date"}}, UNDATED_PROCESSED]
+        else:
+            match.update(_bucket_match("processed_at", processed_hours, UNDATED_PROCESSED))
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": _bucket_of("processed_at"),
+                "processed": {"$sum": 1},
+                "compliant": {"$sum": {"$cond": [{"$eq": [db.STATUS_CODE_EXPR, db.STATUS_COMPLIANT]}, 1, 0]}},
+                "violation": {"$sum": {"$cond": [{"$eq": [db.STATUS_CODE_EXPR, db.STATUS_VIOLATION]}, 1, 0]}},
+            }},
+        ]
+        for row in collection.aggregate(pipeline, allowDiskUse=True):
+            buckets[row["_id"]].update(
+                processed=row["processed"],
+                compliant=row["compliant"],
+                violation=row["violation"],
+            )
+
+    return buckets
+
+
+def _touched_hours(collection, last_id, id_cutoff, last_processed_at, processed_cutoff):
+    """Buckets that change because of documents past the watermarks"""
+    upload_hours, processed_hours = set(), set()
+
+    pipeline = [
+        {"$match": {
+            "_id": sync_jobs.watermark_range(last_id, id_cutoff),
+            "$or": [{"uploaded_at": {"$type": "date"}}, UNDATED_UPLOAD],
+        }},
+        {"$group": {"_id": _bucket_of("uploaded_at")}},
+    ]
+    upload_hours.update(row["_id"] for row in collection.aggregate(pipeline))
+
+    processed_range = sync_jobs.watermark_range(last_processed_at, processed_cutoff)
+    pipeline = [
+        {"$match": {"processed": True, "processed_at": processed_range}},
+        {"$group": {"_id": {"processed": _hour_of("processed_at"), "uploaded": _bucket_of("uploaded_at")}}},
+    ]
+    for row in collection.aggregate(pipeline):
+        processed_hours.add(row["_id"]["processed"])
+        # Processing also moves the document out of its upload hour's unprocessed count
+        upload_hours.add(row["_id"]["uploaded"])
+
+    # No watermark finds documents processed without a processed_at; the
+    # processed_at index makes recounting them on every sync cheap
+    processed_hours.add(db.ROLLUP_UNDATED)
+
+    return upload_hours, processed_hours
+
+
+def _write_buckets(rollups, buckets, upload_hours=None, processed_hours=None):
+    """Overwrite buckets; hours that were recounted but came back empty get zeros"""
+    upload_fields = ("uploaded", "unprocessed")
+    processed_fields = ("processed", "compliant", "violation")
+    operations = []
+
+    for hour in set(buckets) | set(upload_hours or ()) | set(processed_hours or ()):
+        counts = buckets.get(hour, dict.fromkeys(db.ROLLUP_COUNT_FIELDS, 0))
+        fields = {}
+        if upload_hours is None or hour in upload_hours:
+            fields.update({field: counts[field] for field in upload_fields})
+        if processed_hours is None or hour in processed_hours:
+            fields.update({field: counts[field] for field in processed_fields})
+        operations.append(UpdateOne({"_id": hour}, {"$set": fields}, upsert=True))
+
+    for start in range(0, len(operations), 500):
+        rollups.bulk_write(operations[start:start + 500], ordered=False)
+
+    return len(operations)
+
+
+# ===== LEASE =====
+def _acquire_lease(state, owner, seconds):
+    """Take the single-writer lease; False when another sync holds it"""
+    now = sync_jobs.now()
+    try:
+        state.find_one_and_update(
+            {"_id": db.ROLLUP_STATE_ID, "$or": [
+                {"lease_until": {"$exists": False}},
+                {"lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"lease_owner": owner, "lease_until": now + datetime.timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _release_lease(state, owner, updates):
+    update = {"$unset": {"lease_owner": "", "lease_until": ""}}
+    if updates:
+        update["$set"] = updates
+    state.update_one({"_id": db.ROLLUP_STATE_ID, "lease_owner": owner}, update)
+
+
+def _take_down(state, owner):
+    """Send readers back to the raw collection before the buckets are deleted"""
+    state.update_one(
+        {"_id": db.ROLLUP_STATE_ID, "lease_owner": owner},
+        {"$unset": {"built_at": "", "synced_at": ""}},
+    )
+    # Dashboards cache the rollup state, give them time to notice
+    drain = get_setting("ROLLUP_REBUILD_DRAIN_SECONDS", db.ROLLUP_STATE_TTL, float)
+    print(f"Waiting {drain:.0f}s for dashboards to stop reading the rollups")
+    time.sleep(drain)
+
+
+# ===== JOBS =====
+def sync(rebuild=False):
+    """Bring the hourly buckets up to date; returns the number of buckets written"""
+    collection = db.get_collection()
+    rollups = db.get_rollup_collection()
+    state = db.get_rollup_state_collection()
+
+    owner = str(ObjectId())
+    if not _acquire_lease(state, owner, get_setting("ROLLUP_LEASE_SECONDS", 600, int)):
+        print("Another rollup sync is running, skipping")
+        return 0
+
+    processed_cutoff, id_cutoff = sync_jobs.cutoffs("ROLLUP_SETTLE_SECONDS")
+
+    try:
+        current = state.find_one({"_id": db.ROLLUP_STATE_ID}) or {}
+
+        if rebuild or not current.get("built_at"):
+            if current.get("built_at"):
+                _take_down(state, owner)
+            rollups.delete_many({})
+            buckets = count_buckets(collection)
+            written = _write_buckets(rollups, buckets)
+        else:
+            upload_hours, processed_hours = _touched_hours(
+                collection,
+                current.get("last_id"), id_cutoff,
+                current.get("last_processed_at"), processed_cutoff,
+            )
+            buckets = count_buckets(collection, upload_hours, processed_hours)
+            written = _write_buckets(rollups, buckets, upload_hours, processed_hours)
+
+        now = sync_jobs.now()
+        updates = {
+            "last_id": id_cutoff,
+            "last_processed_at": processed_cutoff,
+            "synced_at": now,
+        }
+        if rebuild or not current.get("built_at"):
+            updates["built_at"] = now
+        _release_lease(state, owner, updates)
+    except Exception:
+        try:
+            _release_lease(state, owner, {})
+        except PyMongoError as e:
+            # Keep the original error; the lease expires after ROLLUP_LEASE_SECONDS
+            print(f"Could not release the rollup lease: {e}")
+        raise
+
+    return written
+
+
+def main():
+    sync_jobs.main("Maintain the hourly compliance rollups", sync, "hourly buckets")
+
+
+if __name__ == "__main__":
+    main()
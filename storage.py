@@ -0,0 +1,197 @@
+"""Azure Blob Storage access for detection images.
+
+Image bytes go through a process-wide `ImageCache`, so every session
+shares one memory + disk cache. A cached copy is revalidated with a
+conditional request on its ETag (after IMAGE_CACHE_REVALIDATE_SECONDS in
+memory, on every disk hit), so an overwritten blob is downloaded again
+while an unchanged one costs only a 304.
+
+With IMAGE_DELIVERY=sas the pages hand the browser short-lived read-only
+SAS URLs instead, so images no longer pass through the dashboard host.
+This needs an account-key connection string (Azurite's
+`UseDevelopmentStorage=true` works for local testing); otherwise the
+pages fall back to proxying the bytes.
+"""
+import datetime
+import os
+import tempfile
+import threading
+
+import metrics
+from config import get_setting
+from image_cache import ImageCache
+
+MB = 1024 * 1024
+
+
+# ===== CONNECTION =====
+@metrics.cache_resource()
+def get_blob_service_client():
+    """Initialize Azure Blob Storage client with authentication"""
+    # The Azure SDK is imported on first use, not when a page imports this module
+    from azure.storage.blob import BlobServiceClient
+
+    return BlobServiceClient.from_connection_string(
+        get_setting("AZURE_STORAGE_CONNECTION_STRING")
+    )
+
+
+@metrics.cache_resource()
+def get_image_cache():
+    """Create the image cache shared by all sessions of this process"""
+    cache = ImageCache(
+        memory_max_bytes=get_setting("IMAGE_CACHE_MEMORY_MB", 128, int) * MB,
+        disk_dir=get_setting(
+            "IMAGE_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "helmet-dashboard-images")
+        ),
+        disk_max_bytes=get_setting("IMAGE_CACHE_DISK_MB", 2048, int) * MB,
+    )
+    metrics.register_gauges(
+        lambda: {f"dashboard_image_cache_{key}": value for key, value in cache.stats().items()}
+    )
+    return cache
+
+
+# ===== BLOBS =====
+def parse_blob_url(blob_url):
+    """Split a blob URL into (container, blob name).
+
+    Example URL: https://storagetugas.blob.core.windows.net/photo/photo_20251113_171531_427061.jpg
+    """
+    parts = blob_url.split('/')
+    return parts[-2], parts[-1]
+
+
+def get_blob_client(blob_url):
+    container_name, blob_name = parse_blob_url(blob_url)
+    return get_blob_service_client().get_blob_client(
+        container=container_name,
+        blob=blob_name
+    )
+
+
+def download_blob(blob_url, etag=None):
+    """Download a blob, returning (bytes, etag); None when it still matches `etag`"""
+    from azure.core import MatchConditions
+    from azure.core.exceptions import ResourceNotModifiedError
+
+    conditions = {}
+    if etag:
+        conditions = {"etag": etag, "match_condition": MatchConditions.IfModified}
+    with metrics.timed("blob", "download") as span:
+        try:
+            downloader = get_blob_client(blob_url).download_blob(**conditions)
+        except ResourceNotModifiedError:
+            return None
+        data = downloader.readall()
+        span.bytes = len(data)
+    return data, downloader.properties.etag
+
+
+def blob_etag(blob_url):
+    """Current ETag of a blob, from a properties request that transfers no content"""
+    with metrics.timed("blob", "properties"):
+        return get_blob_client(blob_url).get_blob_properties().etag
+
+
+def revalidate_after():
+    """Seconds a cached copy in memory is trusted before its ETag is checked again"""
+    return get_setting("IMAGE_CACHE_REVALIDATE_SECONDS", 300, float)
+
+
+def load_image(blob_url):
+    """Return (bytes, etag) of the image at `blob_url`, downloading only when the blob changed"""
+    cache = get_image_cache()
+    entry = cache.lookup(blob_url)
+    etag = None
+    if entry is not None:
+        etag, data, age = entry
+        if age is not None and age < revalidate_after():
+            return data, etag
+    fresh = download_blob(blob_url, etag)
+    if fresh is None:
+        cache.confirm(blob_url, data, etag)
+        return data, etag
+    data, etag = fresh
+    cache.put(blob_url, data, etag)
+    return data, etag
+
+
+def load_image_bytes(blob_url):
+    """Return the image bytes for `blob_url`, downloading only when the blob changed"""
+    return load_image(blob_url)[0]
+
+
+# ===== SAS URLS =====
+class SasUrlCache:
+    """SAS URLs per blob, reused until they get close to expiry"""
+
+    def __init__(self):
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, refresh_before):
+        with self._lock:
+            entry = self._urls.get(key)
+        if entry is not None and entry[1] - datetime.datetime.now(datetime.timezone.utc) > refresh_before:
+            return entry[0]
+        return None
+
+    def put(self, key, url, expires_at):
+        with self._lock:
+            self._urls[key] = (url, expires_at)
+            # Drop expired entries so the dict stays bounded by what is in use
+            if len(self._urls) > 10000:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                self._urls = {k: v for k, v in self._urls.items() if v[1] > now}
+
+
+@metrics.cache_resource()
+def get_sas_url_cache():
+    return SasUrlCache()
+
+
+def can_sign_sas():
+    """True when the connection string carries an account key to sign SAS URLs"""
+    return getattr(get_blob_service_client().credential, "account_key", None) is not None
+
+
+def sas_enabled():
+    """True when images should be delivered to the browser through SAS URLs"""
+    if get_setting("IMAGE_DELIVERY", "proxy").lower() != "sas":
+        return False
+    return can_sign_sas()
+
+
+def get_sas_url(container_name, blob_name):
+    """Short-lived read-only URL for a blob, cached until near expiry"""
+    ttl = datetime.timedelta(seconds=get_setting("SAS_TTL_SECONDS", 900, int))
+    cache = get_sas_url_cache()
+    key = f"{container_name}/{blob_name}"
+
+    url = cache.get(key, refresh_before=ttl / 3)
+    if url is None:
+        from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+
+        service_client = get_blob_service_client()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        expires_at = now + ttl
+        sas_token = generate_blob_sas(
+            account_name=service_client.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            account_key=service_client.credential.account_key,
+            permission=BlobSasPermissions(read=True),
+            start=now - datetime.timedelta(minutes=5),  # tolerate clock skew
+            expiry=expires_at,
+        )
+        blob_client = service_client.get_blob_client(container=container_name, blob=blob_name)
+        url = f"{blob_client.url}?{sas_token}"
+        cache.put(key, url, expires_at)
+    return url
+
+
+def get_image_sas_url(blob_url):
+    """SAS URL for the original image behind `blob_url`"""
+    return get_sas_url(*parse_blob_url(blob_url))
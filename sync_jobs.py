@@ -0,0 +1,56 @@
+"""Plumbing shared by the incremental sync jobs (rollup.py, replica.py).
+
+Both jobs pick up documents inserted after an `_id` watermark or processed
+after a `processed_at` watermark, stopping a settle delay short of now so
+writes still in flight are never skipped, and both run from the same
+sync / rebuild / --every command line.
+"""
+import argparse
+import datetime
+import time
+
+from bson import ObjectId
+
+from config import get_setting
+
+
+def now():
+    """Current time as naive UTC, matching how BSON dates are returned"""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def cutoffs(settle_setting):
+    """(processed_at cutoff, _id cutoff) for a sync starting now.
+
+    Leaves recent writes `settle_setting` seconds (default 30) to land so
+    the watermarks never skip a document.
+    """
+    settle = datetime.timedelta(seconds=get_setting(settle_setting, 30, int))
+    processed_cutoff = now() - settle
+    return processed_cutoff, ObjectId.from_datetime(processed_cutoff)
+
+
+def watermark_range(last, cutoff):
+    """Range condition for values after the `last` watermark, up to `cutoff`"""
+    value_range = {"$lte": cutoff}
+    if last is not None:
+        value_range["$gt"] = last
+    return value_range
+
+
+def main(description, sync, unit):
+    """Command line of a sync job; `sync(rebuild)` returns how many `unit` it wrote"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("command", choices=["sync", "rebuild"])
+    parser.add_argument("--every", type=int, default=0, help="repeat sync every N seconds")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Rebuilt {sync(rebuild=True)} {unit}")
+        return
+
+    while True:
+        print(f"{now():%Y-%m-%d %H:%M:%S} synced {sync()} {unit}")
+        if not args.every:
+            break
+        time.sleep(args.every)
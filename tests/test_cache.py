@@ -0,0 +1,66 @@
+"""Single-flight results shared between replicas through the SQLite backend."""
+import time
+
+import pytest
+
+import cache_backends
+from cache import single_flight
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    backend = cache_backends.SQLiteBackend(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(cache_backends, "get_backend", lambda: backend)
+    monkeypatch.setenv("TEST_STATS_TTL", "60")
+    return backend
+
+
+def replica(calls):
+    """The same cached function as a separate replica process would have it"""
+    @single_flight("TEST_STATS_TTL", 60)
+    def stats(day):
+        calls.append(day)
+        return {"day": day, "calls": len(calls)}
+    return stats
+
+
+def test_replicas_share_one_query(backend):
+    calls = []
+    first, second = replica(calls), replica(calls)
+
+    assert first(1) == second(1) == {"day": 1, "calls": 1}
+    assert calls == [1]
+
+
+def test_clear_recomputes_despite_a_shared_result(backend):
+    calls = []
+    first, second = replica(calls), replica(calls)
+    first(1)
+
+    second.clear()
+
+    assert second(1) == {"day": 1, "calls": 2}
+
+
+def test_refresh_reuses_only_a_recent_shared_result(backend, monkeypatch):
+    monkeypatch.setenv("TEST_STATS_TTL", "0.4")
+    calls = []
+    first, second = replica(calls), replica(calls)
+    first(1)
+
+    # Stored by another replica a moment ago: shared
+    assert second.refresh(1) == {"day": 1, "calls": 1}
+
+    time.sleep(0.25)
+    # Past half its TTL: computed again
+    assert second.refresh(1) == {"day": 1, "calls": 2}
+
+
+def test_backend_errors_fall_back_to_computing(backend, monkeypatch):
+    def broken(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(backend, "get", broken)
+    calls = []
+
+    assert replica(calls)(1) == {"day": 1, "calls": 1}
+    assert calls == [1]
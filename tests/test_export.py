@@ -0,0 +1,82 @@
+"""Exports stream every matching row and keep locally served files small."""
+import csv
+import datetime
+import os
+import time
+import zipfile
+
+import mongomock
+import pytest
+
+import db
+import export
+import storage
+from image_cache import ImageCache
+
+START = datetime.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def collection(monkeypatch, tmp_path):
+    collection = mongomock.MongoClient().db.image_metadata
+    collection.insert_many([
+        {
+            "filename": f"photo_{i}.jpg",
+            "uploaded_at": START + datetime.timedelta(minutes=i),
+            "helmet_status": "helmet" if i % 3 else "no_helmet",
+            "url": f"https://account.blob.core.windows.net/photo/photo_{i}.jpg",
+        }
+        for i in range(120)
+    ])
+    monkeypatch.setattr(db, "get_collection", lambda: collection)
+    cache = ImageCache(memory_max_bytes=1024 * 1024, disk_dir=None, disk_max_bytes=0)
+    monkeypatch.setattr(storage, "get_image_cache", lambda: cache)
+    monkeypatch.setattr(storage, "download_blob", lambda url, etag=None: (url.encode(), '"1"'))
+    monkeypatch.setenv("EXPORT_DIR", str(tmp_path))
+    monkeypatch.delenv("EXPORT_CONTAINER", raising=False)
+    return collection
+
+
+def test_csv_export_writes_every_row_in_batches(collection, monkeypatch):
+    monkeypatch.setenv("EXPORT_BATCH_SIZE", "50")
+    seen = []
+
+    path, rows = export.export_to_file(db.build_filter_query("violation"), "CSV", seen.append)
+
+    with open(path, encoding="utf-8") as f:
+        exported = list(csv.DictReader(f))
+    assert rows == len(exported) == 40
+    assert seen == [40]
+    assert {row["status_code"] for row in exported} == {str(db.STATUS_VIOLATION)}
+
+
+def test_local_zip_export_is_capped(collection, monkeypatch):
+    monkeypatch.setenv("EXPORT_LOCAL_MAX_IMAGES", "25")
+    monkeypatch.setenv("EXPORT_MAX_IMAGES", "1000")
+
+    path, rows, failed = export.export_images_zip({})
+
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+    assert (rows, failed) == (25, 0)
+    assert len(names) == 26 and "manifest.csv" in names
+    # Newest first
+    assert "images/photo_119.jpg" in names
+
+
+def test_oversized_local_export_is_not_served(collection, monkeypatch):
+    path, _ = export.export_to_file({}, "CSV")
+    monkeypatch.setenv("EXPORT_LOCAL_MAX_MB", "0.001")
+    assert not export.servable(path)
+    monkeypatch.setenv("EXPORT_LOCAL_MAX_MB", "200")
+    assert export.servable(path)
+
+
+def test_sweep_removes_expired_exports(collection, monkeypatch):
+    old_path, _ = export.export_to_file({}, "CSV")
+    os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+
+    new_path, _ = export.export_to_file({}, "CSV")
+
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
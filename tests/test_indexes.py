@@ -0,0 +1,38 @@
+"""Every canonical dashboard query must be answered from an index."""
+import datetime
+import os
+import random
+
+import pytest
+from pymongo import MongoClient
+
+import indexes
+from tools.generate_data import make_document
+
+
+def test_plan_problems_reports_only_the_winning_plan():
+    explain = {"queryPlanner": {
+        "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        "rejectedPlans": [{"stage": "COLLSCAN"}],
+    }}
+    assert indexes.plan_problems(explain) == []
+    explain["queryPlanner"]["winningPlan"] = {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+    assert indexes.plan_problems(explain) == ["collection scan", "in-memory sort"]
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_MONGO_URI"), reason="needs a MongoDB server in TEST_MONGO_URI")
+def test_no_canonical_query_scans_the_collection():
+    client = MongoClient(os.environ["TEST_MONGO_URI"])
+    collection = client["helmet_dashboard_test"]["image_metadata"]
+    collection.drop()
+    try:
+        rng = random.Random(3)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        start = now - datetime.timedelta(days=30)
+        collection.insert_many([make_document(rng, start, 31, now) for _ in range(5000)])
+        indexes.ensure_indexes(collection)
+
+        assert {name: problems for name, problems in indexes.check(collection).items() if problems} == {}
+    finally:
+        collection.drop()
+        client.close()
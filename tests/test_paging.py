@@ -0,0 +1,47 @@
+"""Keyset paging of the Detail Data records must reach every document."""
+import datetime
+
+import mongomock
+import pytest
+
+import columnar
+import db
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = mongomock.MongoClient().db.image_metadata
+    monkeypatch.setattr(db, "get_collection", lambda: collection)
+    # Decode through the plain cursor path, mongomock has no pymongoarrow support
+    monkeypatch.setattr(columnar, "_find_arrow", lambda *args: None)
+    return collection
+
+
+def _all_pages(limit):
+    get_page = db.get_records_page.__wrapped__
+    cursor, seen = None, []
+    while True:
+        records, has_next = get_page(limit=limit, cursor=cursor)
+        seen.extend(records["_id"])
+        if not has_next:
+            return seen
+        cursor = db.page_cursor(records)
+
+
+def test_pages_reach_documents_without_uploaded_at(collection):
+    start = datetime.datetime(2024, 1, 1)
+    collection.insert_many([
+        {"filename": f"photo_{i}.jpg", "uploaded_at": start + datetime.timedelta(minutes=i // 3)}
+        for i in range(2000)
+    ])
+    collection.insert_one({"filename": "missing.jpg"})
+    collection.insert_one({"filename": "null.jpg", "uploaded_at": None})
+
+    seen = _all_pages(limit=300)
+
+    assert len(seen) == len(set(seen)) == 2002
+
+
+def test_keyset_after_null_uploaded_at_pages_on_id():
+    last_id = object()
+    assert db.keyset_query((None, last_id)) == {"uploaded_at": None, "_id": {"$lt": last_id}}
@@ -0,0 +1,49 @@
+"""Prefetcher de-duplication and bookkeeping."""
+import threading
+
+from prefetch import Prefetcher, neighbour_indices
+
+
+def _run_with_timeout(func, timeout=5):
+    """Run `func` in a thread, failing instead of hanging the suite if it deadlocks"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "deadlocked"
+    return result["value"]
+
+
+def test_prefetch_with_instant_loader_does_not_deadlock():
+    prefetcher = Prefetcher(lambda key: key.upper(), max_workers=2)
+
+    for _ in range(50):
+        futures = _run_with_timeout(lambda: prefetcher.prefetch([f"url-{i}" for i in range(20)]))
+        assert [future.result(timeout=5) for future in futures] == [f"URL-{i}" for i in range(20)]
+
+    # Finished prefetches are forgotten
+    assert _run_with_timeout(lambda: prefetcher.prefetch(["url-0"]))[0].result(timeout=5) == "URL-0"
+
+
+def test_load_joins_a_running_prefetch():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader(key):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return key
+
+    prefetcher = Prefetcher(loader, max_workers=1)
+    prefetcher.prefetch(["a"])
+    started.wait(5)
+    threading.Timer(0.05, release.set).start()
+
+    assert prefetcher.load("a") == "a"
+    assert calls == ["a"]
+
+
+def test_neighbour_indices_nearest_first():
+    assert neighbour_indices(0, 5, 2) == [1, 2]
+    assert neighbour_indices(2, 5, 2) == [3, 1, 4, 0]
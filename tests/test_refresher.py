@@ -0,0 +1,33 @@
+"""Home page snapshots are served without waiting on the database."""
+import datetime
+
+import db
+from refresher import Refresher
+
+
+def test_failed_refresh_keeps_the_last_snapshot():
+    results = iter([{"total": 1}, RuntimeError("server selection timeout")])
+
+    def load():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    refresher = Refresher({"stats": load}, interval=60)
+    assert refresher.get("stats", timeout=0) is None
+
+    refresher.refresh()
+    refresher.refresh()
+    assert refresher.get("stats", timeout=0).value == {"total": 1}
+    assert refresher.error("stats") == "server selection timeout"
+
+
+def test_rollup_freshness_from_a_snapshot_value(monkeypatch):
+    monkeypatch.setenv("ROLLUP_MAX_AGE", "900")
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    assert db.rollup_age(None) is None
+    assert not db.rollup_is_fresh(db.rollup_age(None))
+    assert db.rollup_is_fresh(db.rollup_age(now - datetime.timedelta(minutes=5)))
+    assert not db.rollup_is_fresh(db.rollup_age(now - datetime.timedelta(minutes=20)))
@@ -0,0 +1,69 @@
+"""The local replica must answer the Analitik queries like Cosmos does."""
+import datetime
+import os
+import random
+
+import mongomock
+import pytest
+
+import db
+import replica
+import sync_jobs
+from tools.generate_data import make_document
+
+START = datetime.datetime(2024, 1, 1)
+NOW = datetime.datetime(2024, 1, 15)
+
+
+@pytest.fixture(params=["duckdb", "pandas"])
+def collection(request, monkeypatch, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    else:
+        monkeypatch.setattr(replica, "_duckdb", lambda: None)
+    collection = mongomock.MongoClient().db.image_metadata
+    monkeypatch.setattr(db, "get_collection", lambda: collection)
+    monkeypatch.setattr(sync_jobs, "now", lambda: NOW)
+    monkeypatch.setenv("REPLICA_DIR", str(tmp_path))
+    monkeypatch.setenv("USE_ROLLUPS", "false")
+    # Versions restart at 1 in every replica directory
+    for cached in (replica._stats, replica._daily, replica._hourly):
+        cached.clear()
+
+    rng = random.Random(7)
+    collection.insert_many([make_document(rng, START, 14, NOW, unprocessed_rate=0.1) for _ in range(500)])
+    return collection
+
+
+def _assert_matches_cosmos():
+    assert replica.get_database_stats() == db.get_database_stats.__wrapped__()
+    for since in (None, datetime.date(2024, 1, 10)):
+        assert replica.get_daily_violations(since) == db.get_daily_violations.__wrapped__(since)
+        assert replica.get_hourly_violations(since) == db.get_hourly_violations.__wrapped__(since)
+
+
+def test_replica_matches_cosmos(collection):
+    assert replica.sync() == 500
+    _assert_matches_cosmos()
+
+
+def test_incremental_sync_replaces_processed_rows(collection, monkeypatch):
+    replica.sync()
+    pending = collection.find_one({"processed": False})
+    later = NOW + datetime.timedelta(hours=1)
+    collection.update_one({"_id": pending["_id"]}, {"$set": {
+        "processed": True, "processed_at": later, "status_code": db.STATUS_VIOLATION,
+    }})
+    monkeypatch.setattr(sync_jobs, "now", lambda: later + datetime.timedelta(hours=1))
+
+    assert replica.sync() == 1
+    _assert_matches_cosmos()
+
+
+def test_rebuild_drops_deleted_documents(collection):
+    replica.sync()
+    collection.delete_one({})
+
+    assert replica.sync(rebuild=True) == 499
+    _assert_matches_cosmos()
+    assert sorted(os.listdir(os.environ["REPLICA_DIR"])) == ["gen-0002", replica.STATE_FILE]
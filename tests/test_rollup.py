@@ -0,0 +1,78 @@
+"""Hourly rollups must agree with aggregating the raw collection."""
+import datetime
+import random
+
+import mongomock
+import pytest
+
+import db
+import rollup
+import sync_jobs
+from tools.generate_data import make_document
+
+START = datetime.datetime(2024, 1, 1)
+NOW = datetime.datetime(2024, 1, 15)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = mongomock.MongoClient().image_database
+    monkeypatch.setattr(db, "get_database", lambda: database)
+    monkeypatch.setattr(sync_jobs, "now", lambda: NOW)
+    monkeypatch.setenv("ROLLUP_REBUILD_DRAIN_SECONDS", "0")
+
+    rng = random.Random(11)
+    database.image_metadata.insert_many([make_document(rng, START, 14, NOW) for _ in range(300)])
+    return database
+
+
+def test_rebuild_sends_readers_to_the_raw_collection(database, monkeypatch):
+    rollup.sync()
+    assert db.rollup_synced_at.__wrapped__() == NOW
+
+    seen_during_rebuild = []
+    monkeypatch.setattr(rollup.time, "sleep", lambda seconds: seen_during_rebuild.append(
+        db.rollup_synced_at.__wrapped__()
+    ))
+    rollup.sync(rebuild=True)
+
+    # Not built while the buckets were deleted and recounted, built again after
+    assert seen_during_rebuild == [None]
+    assert db.rollup_synced_at.__wrapped__() == NOW
+
+
+def _assert_matches_raw(monkeypatch):
+    monkeypatch.setenv("USE_ROLLUPS", "false")
+    raw = (
+        db.get_database_stats.__wrapped__(),
+        db.get_daily_violations.__wrapped__(),
+        db.get_hourly_violations.__wrapped__(datetime.date(2024, 1, 10)),
+    )
+    monkeypatch.delenv("USE_ROLLUPS")
+    assert (
+        db._rollup_stats(),
+        db._rollup_violations(None, {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id"}}, "date"),
+        db._rollup_violations(datetime.date(2024, 1, 10), {"$hour": "$_id"}, "hour"),
+    ) == raw
+
+
+def test_rollups_count_documents_without_dates(database, monkeypatch):
+    collection = database.image_metadata
+    collection.insert_many([
+        {"filename": "no_upload_date.jpg", "processed": False},
+        {"filename": "null_upload_date.jpg", "uploaded_at": None, "processed": True,
+         "processed_at": NOW - datetime.timedelta(hours=1), "status_code": db.STATUS_VIOLATION},
+        {"filename": "no_processed_date.jpg", "uploaded_at": NOW - datetime.timedelta(hours=2),
+         "processed": True, "status_code": db.STATUS_COMPLIANT},
+    ])
+
+    rollup.sync()
+    _assert_matches_raw(monkeypatch)
+
+    # New undated documents and documents processed without a processed_at reach an incremental sync
+    later = NOW + datetime.timedelta(hours=1)
+    monkeypatch.setattr(sync_jobs, "now", lambda: later)
+    collection.update_one({"processed": False, "uploaded_at": {"$type": "date"}}, {"$set": {"processed": True}})
+    collection.insert_one({"_id": rollup.ObjectId.from_datetime(NOW), "filename": "late.jpg", "processed": False})
+    rollup.sync()
+    _assert_matches_raw(monkeypatch)
@@ -0,0 +1,61 @@
+"""Cached thumbnails follow the original they were made from."""
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import storage
+import thumbnails
+from image_cache import ImageCache
+
+URL = "https://account.blob.core.windows.net/photo/photo_1.jpg"
+
+
+def _jpeg(color):
+    out = BytesIO()
+    Image.new("RGB", (800, 600), color).save(out, format="JPEG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def blob(monkeypatch, tmp_path):
+    """The original behind URL, as {"data", "etag"}; loads are counted in "loads" """
+    blob = {"data": _jpeg("red"), "etag": '"1"', "loads": 0}
+
+    def load_image(blob_url):
+        blob["loads"] += 1
+        return blob["data"], blob["etag"]
+
+    cache = ImageCache(memory_max_bytes=10 * 1024 * 1024, disk_dir=str(tmp_path), disk_max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(storage, "get_image_cache", lambda: cache)
+    monkeypatch.setattr(storage, "load_image", load_image)
+    monkeypatch.setattr(storage, "blob_etag", lambda blob_url: blob["etag"])
+    monkeypatch.delenv("THUMBNAIL_CONTAINER", raising=False)
+    return blob
+
+
+def _color(data):
+    return Image.open(BytesIO(data)).convert("RGB").getpixel((10, 10))
+
+
+def test_thumbnail_is_served_from_cache_while_fresh(blob, monkeypatch):
+    monkeypatch.setenv("IMAGE_CACHE_REVALIDATE_SECONDS", "300")
+    first = thumbnails.load_thumbnail(URL, 256)
+    blob.update(data=_jpeg("blue"), etag='"2"')
+
+    assert thumbnails.load_thumbnail(URL, 256) == first
+    assert blob["loads"] == 1
+
+
+def test_thumbnail_is_remade_when_the_original_changes(blob, monkeypatch):
+    monkeypatch.setenv("IMAGE_CACHE_REVALIDATE_SECONDS", "0")
+    thumbnails.load_thumbnail(URL, 256)
+
+    # Unchanged original: revalidated, not remade
+    thumbnails.load_thumbnail(URL, 256)
+    assert blob["loads"] == 1
+
+    blob.update(data=_jpeg("blue"), etag='"2"')
+    red, green, blue = _color(thumbnails.load_thumbnail(URL, 256))
+    assert blue > 200 and red < 50
+    assert blob["loads"] == 2
@@ -0,0 +1,244 @@
+"""Thumbnail generation for detection images.
+
+Thumbnails are produced lazily on first request and kept in the shared
+image cache, next to the original they were made from, so the gallery and
+preview sizes share one download. When THUMBNAIL_CONTAINER is set they
+are also stored in that Blob Storage container, so they are generated once
+for all replicas; the batch CLI fills the container ahead of time, making
+every size from a single download of each original. Every thumbnail
+remembers the ETag of its original, so one made from an image that was
+since overwritten is made again.
+
+Usage:
+    python thumbnails.py                  # thumbnails for all records
+    python thumbnails.py --since 2025-11-01 --workers 16
+"""
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import db
+import metrics
+import storage
+from cache import LRUCache
+from config import get_setting
+
+# Longest edge in pixels for each use
+THUMBNAIL_SIZES = {
+    "gallery": 256,
+    "preview": 640,
+}
+
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+# Blob metadata key of a stored thumbnail holding the ETag of its original
+SOURCE_ETAG = "source_etag"
+
+
+def _format():
+    return get_setting("THUMBNAIL_FORMAT", "WEBP").upper()
+
+
+def make_thumbnail(data, max_size, fmt="WEBP", quality=80):
+    """Downscale encoded image bytes so the longest edge is at most `max_size`"""
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", (max_size, max_size))  # cheap JPEG downscale while decoding
+    img = img.convert("RGB")
+    img.thumbnail((max_size, max_size))
+    out = BytesIO()
+    img.save(out, format=fmt, quality=quality)
+    return out.getvalue()
+
+
+def thumbnail_blob_name(blob_url, size, fmt):
+    """Name of the thumbnail blob, e.g. '256/photo_20251113_171531_427061.webp'"""
+    _, blob_name = storage.parse_blob_url(blob_url)
+    stem = blob_name.rsplit('.', 1)[0]
+    return f"{size}/{stem}.{fmt.lower()}"
+
+
+def _thumbnail_blob_client(blob_url, size, fmt):
+    container = get_setting("THUMBNAIL_CONTAINER")
+    if not container:
+        return None
+    return storage.get_blob_service_client().get_blob_client(
+        container=container,
+        blob=thumbnail_blob_name(blob_url, size, fmt)
+    )
+
+
+def generate_thumbnails(blob_url, sizes, force=False, source_etag=None, load_original=None):
+    """Create (or fetch) the thumbnail blobs at each size; returns ({size: bytes}, original etag).
+
+    The original is loaded at most once, and only when a size is missing,
+    with `load_original` (default storage.load_image). A stored thumbnail
+    is reused unless `source_etag` is given and differs from the ETag of
+    the original it was made from.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.storage.blob import ContentSettings
+
+    fmt = _format()
+    original = None
+    thumbs = {}
+    for size in sizes:
+        thumb_client = _thumbnail_blob_client(blob_url, size, fmt)
+
+        if thumb_client is not None and not force:
+            try:
+                with metrics.timed("blob", "thumbnail_download") as span:
+                    downloader = thumb_client.download_blob()
+                    stored_etag = downloader.properties.metadata.get(SOURCE_ETAG)
+                    if source_etag is None or stored_etag == source_etag:
+                        thumbs[size] = downloader.readall()
+                        span.bytes = len(thumbs[size])
+                        source_etag = stored_etag
+                        continue
+            except ResourceNotFoundError:
+                pass
+
+        if original is None:
+            original, source_etag = (load_original or storage.load_image)(blob_url)
+        with metrics.timed("image", "make_thumbnail"):
+            thumbs[size] = make_thumbnail(original, size, fmt)
+
+        if thumb_client is not None:
+            thumb_client.upload_blob(
+                thumbs[size],
+                overwrite=True,
+                metadata={SOURCE_ETAG: source_etag} if source_etag else None,
+                content_settings=ContentSettings(content_type=CONTENT_TYPES.get(fmt, "application/octet-stream"))
+            )
+    return thumbs, source_etag
+
+
+def load_thumbnail(blob_url, size):
+    """Return thumbnail bytes for `blob_url`, generating it on first request.
+
+    A cached thumbnail is revalidated like the originals: after
+    IMAGE_CACHE_REVALIDATE_SECONDS in memory (and on every disk hit) it is
+    checked against the ETag of the original, and remade when that changed.
+    """
+    cache = storage.get_image_cache()
+    key = f"{blob_url}#thumb{size}"
+    entry = cache.lookup(key)
+    source_etag = None
+    if entry is not None:
+        etag, data, age = entry
+        if age is not None and age < storage.revalidate_after():
+            return data
+        source_etag = storage.blob_etag(blob_url)
+        if etag == source_etag:
+            cache.confirm(key, data, etag)
+            return data
+    thumbs, etag = generate_thumbnails(blob_url, [size], source_etag=source_etag)
+    cache.put(key, thumbs[size], etag)
+    return thumbs[size]
+
+
+@metrics.cache_resource()
+def _stored_thumbnails() -> LRUCache:
+    """Thumbnail blob names recently checked against their original in THUMBNAIL_CONTAINER"""
+    return LRUCache(
+        "stored_thumbnails",
+        max_entries=get_setting("THUMBNAIL_INDEX_SIZE", 20000, int),
+        ttl=get_setting("THUMBNAIL_INDEX_TTL", storage.revalidate_after(), float),
+    )
+
+
+def thumbnail_sas_url(blob_url, size):
+    """SAS URL of the stored thumbnail, creating or remaking it first if needed.
+
+    Returns None when thumbnails are not stored in a container.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    container = get_setting("THUMBNAIL_CONTAINER")
+    if not container:
+        return None
+
+    blob_name = thumbnail_blob_name(blob_url, size, _format())
+    stored = _stored_thumbnails()
+    if not stored.get_many([blob_name]):
+        thumb_client = _thumbnail_blob_client(blob_url, size, _format())
+        try:
+            with metrics.timed("blob", "properties"):
+                stored_etag = thumb_client.get_blob_properties().metadata.get(SOURCE_ETAG)
+        except ResourceNotFoundError:
+            stored_etag = None
+        if stored_etag is None or stored_etag != storage.blob_etag(blob_url):
+            thumbs, etag = generate_thumbnails(blob_url, [size], force=True)
+            storage.get_image_cache().put(f"{blob_url}#thumb{size}", thumbs[size], etag)
+        stored.put_many({blob_name: True})
+    return storage.get_sas_url(container, blob_name)
+
+
+def load_thumbnails(blob_urls, size, workers=8, prefer_sas=False):
+    """Load many thumbnails concurrently; failed or missing images give None.
+
+    With `prefer_sas` each entry is a SAS URL when the thumbnail is stored
+    in a container, and falls back to the bytes otherwise.
+    """
+    def load(blob_url):
+        if not blob_url:
+            return None
+        if prefer_sas:
+            try:
+                url = thumbnail_sas_url(blob_url, size)
+                if url:
+                    return url
+            except Exception:
+                pass
+        try:
+            return load_thumbnail(blob_url, size)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(load, blob_urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate thumbnails into THUMBNAIL_CONTAINER")
+    parser.add_argument("--since", type=datetime.date.fromisoformat, help="only records uploaded on or after this date")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--force", action="store_true", help="regenerate existing thumbnails")
+    args = parser.parse_args()
+
+    if not get_setting("THUMBNAIL_CONTAINER"):
+        parser.error("THUMBNAIL_CONTAINER is not set")
+
+    query = {"$or": [{"url": {"$exists": True}}, {"blob_url": {"$exists": True}}]}
+    if args.since:
+        query["uploaded_at"] = {"$gte": datetime.datetime.combine(args.since, datetime.time.min)}
+    cursor = db.get_collection().find(query, {"url": 1, "blob_url": 1}).batch_size(500)
+
+    def generate(record):
+        blob_url = record.get('url') or record.get('blob_url')
+        try:
+            # One download per record for all sizes, kept out of the image cache
+            generate_thumbnails(blob_url, THUMBNAIL_SIZES.values(), args.force, load_original=storage.download_blob)
+            return True
+        except Exception as e:
+            print(f"Failed {blob_url}: {e}")
+            return False
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        # Work through the cursor in chunks so pending work stays bounded
+        chunk = []
+        for record in cursor:
+            chunk.append(record)
+            if len(chunk) == 500:
+                results = list(pool.map(generate, chunk))
+                done, failed, chunk = done + results.count(True), failed + results.count(False), []
+        results = list(pool.map(generate, chunk))
+        done, failed = done + results.count(True), failed + results.count(False)
+    print(f"Generated thumbnails for {done} records ({failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""Developer tooling: synthetic data, benchmarks and load tests.
+
+Run from the repository root, e.g. `python -m tools.benchmark`.
+"""
@@ -0,0 +1,140 @@
+"""Per-query latency benchmark of the dashboard data functions.
+
+For each dataset size a database `bench_<size>` on a local mongod is
+filled with synthetic documents (once; reused on later runs), then every
+data function behind the three pages is timed with Streamlit caching
+bypassed. With --rollups the stats and trend queries are timed a second
+time against freshly built hourly rollups. Results go to a JSON report
+that can be diffed between runs.
+
+Usage:
+    python -m tools.benchmark --sizes 10000 100000 1000000 --output bench_report.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import time
+
+DEFAULT_URI = "mongodb://localhost:27017"
+
+
+def _uncached(func):
+    """The plain function behind a st.cache_data wrapper"""
+    return getattr(func, "__wrapped__", func)
+
+
+def _cases(db):
+    today = datetime.date.today()
+    month_ago = today - datetime.timedelta(days=29)
+
+    def second_page():
+        records, _ = _uncached(db.get_records_page)(None, None, 100, None)
+        return _uncached(db.get_records_page)(None, None, 100, db.page_cursor(records))
+
+    return {
+        "home: get_database_stats": lambda: _uncached(db.get_database_stats)(),
+        "home: get_recent_records(10)": lambda: _uncached(db.get_recent_records)(10),
+        "home: get_recent_records(100)": lambda: _uncached(db.get_recent_records)(100),
+        "detail: page 1 (all)": lambda: _uncached(db.get_records_page)(None, None, 100, None),
+        "detail: page 2 (all)": second_page,
+        "detail: page 1 (violation)": lambda: _uncached(db.get_records_page)("violation", None, 100, None),
+        "detail: page 1 (1000 rows)": lambda: _uncached(db.get_records_page)(None, None, 1000, None),
+        "detail: one day": lambda: _uncached(db.get_records_page)(None, today, 100, None),
+        "analitik: daily violations (30 days)": lambda: _uncached(db.get_daily_violations)(month_ago),
+        "analitik: hourly violations (30 days)": lambda: _uncached(db.get_hourly_violations)(month_ago),
+        "analitik: daily violations (all)": lambda: _uncached(db.get_daily_violations)(None),
+        "analitik: hourly violations (all)": lambda: _uncached(db.get_hourly_violations)(None),
+    }
+
+
+ROLLUP_CASES = (
+    "home: get_database_stats",
+    "analitik: daily violations (30 days)",
+    "analitik: hourly violations (30 days)",
+    "analitik: daily violations (all)",
+    "analitik: hourly violations (all)",
+)
+
+
+def time_case(func, repeat):
+    """Latency summary in milliseconds; the first (warm-up) call is not counted"""
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def run(sizes, repeat, with_rollups):
+    import db
+    import rollup
+    from indexes import ensure_indexes
+    from tools.generate_data import generate
+
+    report = {}
+    for size in sizes:
+        os.environ["MONGO_DATABASE"] = f"bench_{size}"
+        os.environ["USE_ROLLUPS"] = "false"
+        db.rollup_synced_at.clear()
+
+        collection = db.get_collection()
+        existing = collection.estimated_document_count()
+        if existing != size:
+            print(f"Generating {size} documents...")
+            collection.drop()
+            generate(collection, size)
+        ensure_indexes(collection)
+
+        results = {}
+        for name, func in _cases(db).items():
+            results[name] = time_case(func, repeat)
+            print(f"[{size:>10}] {name:<40} median {results[name]['median_ms']:>10.2f} ms")
+
+        if with_rollups:
+            rollup.sync(rebuild=True)
+            os.environ["USE_ROLLUPS"] = "true"
+            db.rollup_synced_at.clear()
+            cases = _cases(db)
+            for name in ROLLUP_CASES:
+                key = f"{name} [rollup]"
+                results[key] = time_case(cases[name], repeat)
+                print(f"[{size:>10}] {key:<40} median {results[key]['median_ms']:>10.2f} ms")
+
+        report[str(size)] = results
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard queries at several dataset sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--rollups", action="store_true", help="also time stats/trends via hourly rollups")
+    parser.add_argument("--output", default="bench_report.json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("COSMOSDB_CONN_STRING", DEFAULT_URI)
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "sizes": run(args.sizes, args.repeat, args.rollups),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Fill a local MongoDB with realistic synthetic image_metadata documents.
+
+Documents mix both status schemas, carry confidences, follow a diurnal
+upload pattern with processing a few seconds later, and point at blob URLs
+shaped like the production ones. `_id` timestamps follow uploaded_at, as
+they do when the uploader inserts documents.
+
+Usage:
+    python -m tools.generate_data --count 1000000 --database bench_1000000 --drop
+"""
+import argparse
+import datetime
+import os
+import random
+import struct
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+DEFAULT_URI = "mongodb://localhost:27017"
+
+# Relative upload volume per hour of day: morning and afternoon commute peaks
+HOURLY_WEIGHTS = [
+    1, 1, 1, 1, 2, 4, 8, 14, 12, 7, 6, 6,
+    7, 6, 6, 8, 12, 14, 10, 6, 4, 3, 2, 1,
+]
+
+BLOB_BASE_URL = "https://storagetugas.blob.core.windows.net/photo"
+
+
+def _object_id(when, rng):
+    """ObjectId whose embedded timestamp is `when` (naive UTC)"""
+    timestamp = int(when.replace(tzinfo=datetime.timezone.utc).timestamp())
+    return ObjectId(struct.pack(">I", timestamp) + rng.randbytes(8))
+
+
+def make_document(rng, start, days, now, violation_rate=0.25, legacy_rate=0.4,
+                  unprocessed_rate=0.02, status_code_rate=0.0):
+    """One synthetic detection document, never timestamped after `now`"""
+    uploaded_at = (
+        start
+        + datetime.timedelta(days=rng.randrange(days))
+        + datetime.timedelta(hours=rng.choices(range(24), weights=HOURLY_WEIGHTS)[0])
+        + datetime.timedelta(seconds=rng.randrange(3600), microseconds=rng.randrange(1000000))
+    )
+    if uploaded_at > now:
+        # The rest of today has not happened yet: use the same time a day earlier
+        uploaded_at -= datetime.timedelta(days=1)
+    filename = f"photo_{uploaded_at:%Y%m%d_%H%M%S}_{uploaded_at.microsecond:06d}.jpg"
+    doc = {
+        "_id": _object_id(uploaded_at, rng),
+        "filename": filename,
+        "uploaded_at": uploaded_at,
+        "processed": False,
+    }
+    # Older uploads carry `url`, newer ones `blob_url`
+    doc["url" if rng.random() < 0.9 else "blob_url"] = f"{BLOB_BASE_URL}/{filename}"
+
+    if rng.random() >= unprocessed_rate:
+        violation = rng.random() < violation_rate
+        legacy = rng.random() < legacy_rate
+        if violation:
+            status = "no_helmet" if legacy else "violation"
+        else:
+            status = "helmet" if legacy else "compliant"
+        doc.update(
+            processed=True,
+            processed_at=min(uploaded_at + datetime.timedelta(seconds=rng.uniform(0.5, 30)), now),
+            helmet_status=status,
+            confidence=round(rng.uniform(0.45, 0.99), 4),
+        )
+        if rng.random() < status_code_rate:
+            doc["status_code"] = 2 if violation else 1
+    return doc
+
+
+def generate(collection, count, days=90, batch_size=10000, seed=42, **rates):
+    """Insert `count` documents spread over the last `days` days"""
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    start = datetime.datetime.combine(now.date(), datetime.time.min) - datetime.timedelta(days=days - 1)
+
+    inserted = 0
+    while inserted < count:
+        size = min(batch_size, count - inserted)
+        collection.insert_many(
+            [make_document(rng, start, days, now, **rates) for _ in range(size)],
+            ordered=False,
+        )
+        inserted += size
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic image_metadata documents")
+    parser.add_argument("--uri", default=os.environ.get("COSMOSDB_CONN_STRING", DEFAULT_URI))
+    parser.add_argument("--database", default="image_database_synthetic")
+    parser.add_argument("--collection", default="image_metadata")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--violation-rate", type=float, default=0.25)
+    parser.add_argument("--status-code-rate", type=float, default=0.0,
+                        help="fraction of processed documents that already carry status_code")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="drop the collection first")
+    args = parser.parse_args()
+
+    collection = MongoClient(args.uri)[args.database][args.collection]
+    if args.drop:
+        collection.drop()
+
+    inserted = generate(
+        collection, args.count, days=args.days, seed=args.seed,
+        violation_rate=args.violation_rate, status_code_rate=args.status_code_rate,
+    )
+    print(f"Inserted {inserted} documents into {args.database}.{args.collection}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Multi-session load test of the Streamlit pages.
+
+Simulates N concurrent logged-in supervisors, each repeatedly walking the
+home page, Analitik and Detail Data (status filter change plus row
+selection) with Streamlit's `AppTest` driver. All sessions share one
+process, exactly as they share one Streamlit server, so `st.cache_*`
+and the pooled clients behave like production.
+
+Runs against local stand-ins: a mongod (optionally seeded with synthetic
+data) and an Azurite blob endpoint (optionally seeded with small JPEGs for
+the newest records). Reports p50/p95/p99 rerun latency per step, MongoDB
+commands per rerun and process memory.
+
+Usage:
+    python -m tools.loadtest --sessions 20 --iterations 5 --seed 100000 --seed-images 500
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import statistics
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+
+from pymongo import monitoring
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017"
+AZURITE_CONNECTION_STRING = "UseDevelopmentStorage=true"
+DATABASE = "image_database_loadtest"
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts every MongoDB command sent by any client in the process"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB (Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return 0.0
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ===== SEEDING =====
+def seed_data(count):
+    from pymongo import MongoClient
+    from tools.generate_data import generate
+
+    collection = MongoClient(os.environ["COSMOSDB_CONN_STRING"])[DATABASE]["image_metadata"]
+    if collection.estimated_document_count() != count:
+        collection.drop()
+        generate(collection, count)
+
+
+def seed_images(count):
+    """Upload a small JPEG for each of the newest `count` records to Azurite"""
+    from PIL import Image
+
+    import db
+    import storage
+
+    service = storage.get_blob_service_client()
+    buffer = BytesIO()
+    Image.new("RGB", (1280, 720), (120, 140, 160)).save(buffer, format="JPEG")
+    payload = buffer.getvalue()
+
+    containers = set()
+    for doc in db.get_collection().find({}, {"url": 1, "blob_url": 1}).sort(db.NEWEST_FIRST).limit(count):
+        container, blob = storage.parse_blob_url(doc.get("url") or doc.get("blob_url"))
+        if container not in containers:
+            try:
+                service.create_container(container)
+            except Exception:
+                pass  # already exists
+            containers.add(container)
+        service.get_blob_client(container=container, blob=blob).upload_blob(payload, overwrite=True)
+
+
+# ===== SESSIONS =====
+def _app(path, secrets, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(path, default_timeout=timeout)
+    for key, value in secrets.items():
+        app.secrets[key] = value
+    app.session_state["logged_in"] = True
+    app.session_state["username"] = "admin"
+    return app
+
+
+def session_flow(secrets, timeout):
+    """One supervisor walking the pages; yields (step, callable) per rerun"""
+    home = _app("dashboard.py", secrets, timeout)
+    analitik = _app("pages/Analitik.py", secrets, timeout)
+    detail = _app("pages/Detail_Data.py", secrets, timeout)
+
+    def select_first_row():
+        # AppTest cannot click dataframe rows; set the selection the table would set
+        import db
+        records, _ = db.get_records_page("violation", None, 100, None)
+        if len(records):
+            detail.session_state["selected_id"] = records["_id"].iloc[0]
+        detail.run()
+
+    return [
+        ("home", home.run),
+        ("analitik", analitik.run),
+        ("detail: open", detail.run),
+        ("detail: filter", lambda: detail.selectbox[0].select("Melanggar (Tidak Pakai Helm)").run()),
+        ("detail: select row", select_first_row),
+        ("detail: reset filter", lambda: detail.selectbox[0].select("Semua").run()),
+    ]
+
+
+def run_step(step, action, samples, errors, lock):
+    start = time.perf_counter()
+    try:
+        action()
+    except Exception as e:
+        with lock:
+            errors[step] += 1
+        print(f"{step} failed: {e}")
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+    with lock:
+        samples[step].append(elapsed)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    return {
+        step: {
+            "reruns": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+            "mean_ms": round(statistics.mean(values), 1),
+        }
+        for step, values in samples.items() if values
+    }
+
+
+def calibrate(secrets, timeout, counter):
+    """Single-session pass measuring MongoDB commands per rerun of each step"""
+    calls = {}
+    for step, action in session_flow(secrets, timeout):
+        before = counter.count
+        action()
+        calls[step] = counter.count - before
+    return calls
+
+
+def load(sessions, iterations, secrets, timeout, counter):
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def worker():
+        flow = session_flow(secrets, timeout)
+        for _ in range(iterations):
+            for step, action in flow:
+                run_step(step, action, samples, errors, lock)
+
+    commands_before = counter.count
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    reruns = sum(len(values) for values in samples.values())
+    return {
+        "sessions": sessions,
+        "iterations": iterations,
+        "wall_seconds": round(wall, 2),
+        "reruns": reruns,
+        "errors": dict(errors),
+        "db_commands": counter.count - commands_before,
+        "db_commands_per_rerun": round((counter.count - commands_before) / reruns, 2) if reruns else 0,
+        "rss_mb_before": round(rss_before, 1),
+        "rss_mb_after": round(_rss_mb(), 1),
+        "rss_mb_peak": round(_peak_rss_mb(), 1),
+        "steps": summarize(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent session load test for the dashboard pages")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--mongo-uri", default=os.environ.get("COSMOSDB_CONN_STRING", DEFAULT_MONGO_URI))
+    parser.add_argument("--blob-connection-string", default=AZURITE_CONNECTION_STRING)
+    parser.add_argument("--seed", type=int, default=0, help="generate this many synthetic documents first")
+    parser.add_argument("--seed-images", type=int, default=0, help="upload JPEGs for the newest N records")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    # Register before any MongoClient exists so every client reports to it
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    secrets = {
+        "COSMOSDB_CONN_STRING": args.mongo_uri,
+        "AZURE_STORAGE_CONNECTION_STRING": args.blob_connection_string,
+    }
+    os.environ.update(secrets)
+    os.environ["MONGO_DATABASE"] = DATABASE
+
+    if args.seed:
+        seed_data(args.seed)
+    if args.seed_images:
+        seed_images(args.seed_images)
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "db_commands_per_step": calibrate(secrets, args.timeout, counter),
+        "load": load(args.sessions, args.iterations, secrets, args.timeout, counter),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Cold-start benchmark of the page scripts.
+
+Every measurement runs in a fresh interpreter, as after a deploy: the
+child process imports Streamlit's test driver, then times the first run
+of one page with `AppTest`, either on the login prompt or logged in.
+`-X importtime` output of the child gives the slowest top-level imports,
+so a heavy module that creeps back into a page's import path shows up by
+name. Results go to a JSON report that can be diffed between runs.
+
+Usage:
+    python -m tools.startup_bench --repeat 3 --output startup_report.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+PAGES = ["dashboard.py", "pages/Analitik.py", "pages/Detail_Data.py", "pages/Diagnostik.py"]
+
+
+# ===== CHILD =====
+def measure(page, logged_in, timeout):
+    """First-render timings of `page` in this (fresh) process"""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import = time.perf_counter() - start
+
+    modules_before = len(sys.modules)
+    app = AppTest.from_file(page, default_timeout=timeout)
+    if logged_in:
+        app.session_state["logged_in"] = True
+        app.session_state["username"] = "admin"
+
+    start = time.perf_counter()
+    app.run()
+    first_render = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app.run()
+    second_render = time.perf_counter() - start
+
+    return {
+        "streamlit_import_ms": round(streamlit_import * 1000, 1),
+        "first_render_ms": round(first_render * 1000, 1),
+        "second_render_ms": round(second_render * 1000, 1),
+        "modules_loaded_by_page": len(sys.modules) - modules_before,
+        "exception": [str(e.value) for e in app.exception],
+    }
+
+
+# ===== PARENT =====
+def slowest_imports(importtime_output, top):
+    """Top-level imports by cumulative microseconds from `-X importtime` stderr"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; only count the outermost ones
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def run_child(page, logged_in, timeout, top):
+    command = [sys.executable, "-X", "importtime", "-m", "tools.startup_bench",
+               "--child", page, "--timeout", str(timeout)]
+    if logged_in:
+        command.append("--logged-in")
+
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, env=os.environ.copy())
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{page} failed:\n{result.stderr[-2000:]}")
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_wall_ms"] = round(wall * 1000, 1)
+    timings["slowest_imports"] = slowest_imports(result.stderr, top)
+    return timings
+
+
+def summarize(runs):
+    """Median of each numeric timing; import list and errors from the last run"""
+    summary = {
+        key: statistics.median(run[key] for run in runs)
+        for key, value in runs[0].items() if isinstance(value, (int, float))
+    }
+    summary["slowest_imports"] = runs[-1]["slowest_imports"]
+    summary["exception"] = runs[-1]["exception"]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import and first-render time per page")
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page and state")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default="startup_report.json")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--logged-in", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.logged_in, args.timeout)))
+        return
+
+    results = {}
+    for page in args.pages:
+        for state, logged_in in (("login", False), ("logged_in", True)):
+            runs = [run_child(page, logged_in, args.timeout, args.top) for _ in range(args.repeat)]
+            results[f"{page} [{state}]"] = summary = summarize(runs)
+            print(f"{page:<25} {state:<10} process {summary['process_wall_ms']:>8.1f} ms"
+                  f"  first render {summary['first_render_ms']:>8.1f} ms")
+
+    report = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "pages": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()